@@ -0,0 +1,125 @@
+"""Structured logging for the chatbot.
+
+Records are written as JSON lines carrying the `conversation_id` and
+Databricks `task` they belong to, taken from context variables so call
+sites do not have to pass them around. Log calls use %-style arguments,
+and payloads are wrapped in `LazyPayload`, so nothing is formatted or
+serialized unless the record is actually emitted. Large payloads are
+truncated and can be sampled.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for JSON lines, "text" for the plain format during local development.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Serialized payloads longer than this are cut; 0 disables truncation.
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+# Fraction of emitted records that include the full payload.
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+conversation_id_var = contextvars.ContextVar("conversation_id", default=None)
+task_var = contextvars.ContextVar("task", default=None)
+
+_CONTEXT_FIELDS = (("conversation_id", conversation_id_var), ("task", task_var))
+
+
+@contextmanager
+def log_context(**fields):
+    """Tag records logged inside the block, e.g. log_context(task="top3_and_blocks")."""
+    tokens = []
+    for name, var in _CONTEXT_FIELDS:
+        if name in fields:
+            tokens.append((var, var.set(fields[name])))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class LazyPayload:
+    """Log argument that serializes `value` only when the record is formatted."""
+    __slots__ = ("value", "max_chars", "sample_rate")
+
+    def __init__(self, value, max_chars=None, sample_rate=None):
+        self.value = value
+        self.max_chars = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+        self.sample_rate = LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def __str__(self):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return "<payload not sampled>"
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = json.dumps(self.value, default=str, ensure_ascii=False)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... ({len(text) - self.max_chars} more chars)"
+        return text
+
+
+class ContextFilter(logging.Filter):
+    """Copy the context variables onto each record unless passed via `extra`."""
+
+    def filter(self, record):
+        for name, var in _CONTEXT_FIELDS:
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, _ in _CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(ContextFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(conversation_id)s %(task)s] %(message)s"
+        ))
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def set_log_level(level, logger_name=None):
+    """Change a logger's level at runtime; returns the new level name."""
+    numeric = logging.getLevelName(str(level).upper())
+    if not isinstance(numeric, int):
+        raise ValueError(f"Unknown log level: {level}")
+    logging.getLogger(logger_name).setLevel(numeric)
+    return logging.getLevelName(numeric)
+
+
+def get_log_levels():
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in logging.root.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
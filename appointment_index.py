@@ -0,0 +1,72 @@
+"""The appointment IDs already booked.
+
+Every Appointment_ID is remembered, so checking one is a set lookup no
+matter how long the booking history is. The index is rebuilt once at
+startup by streaming the bookings store (`rebuild`), so a replayed state
+token cannot book again after a restart, and is then kept up to date as
+bookings are made (`reserve` / `release`).
+
+Slot loads are not counted here. availability.py checks capacity against
+the endpoint's Appointment_Load plus the bookings made since.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BOOKING_INDEX_REBUILD = os.getenv("BOOKING_INDEX_REBUILD", "true").lower() in ("1", "true", "yes")
+
+RESERVED, DUPLICATE = "reserved", "duplicate"
+
+
+class AppointmentIdIndex:
+    def __init__(self):
+        self._appointments = set()
+        self._lock = threading.Lock()
+        self.rebuilt = {"rows": 0, "seconds": None}
+        self.counters = {"reserved": 0, "duplicates": 0, "released": 0}
+
+    def rebuild(self, rows):
+        """Replace the index with the Appointment_IDs in `rows` (dicts with the booking CSV columns)."""
+        started = time.perf_counter()
+        appointments = set()
+        n_rows = 0
+        for row in rows:
+            n_rows += 1
+            appointment_id = row.get('Appointment_ID')
+            if appointment_id:
+                appointments.add(appointment_id)
+        with self._lock:
+            self._appointments = appointments
+            self.rebuilt = {"rows": n_rows, "seconds": time.perf_counter() - started}
+        return n_rows
+
+    def reserve(self, appointment_id):
+        """Record `appointment_id`; returns RESERVED, or DUPLICATE if the ID is taken."""
+        with self._lock:
+            if appointment_id in self._appointments:
+                self.counters["duplicates"] += 1
+                return DUPLICATE
+            self._appointments.add(appointment_id)
+            self.counters["reserved"] += 1
+            return RESERVED
+
+    def release(self, appointment_id):
+        """Undo a reservation whose booking could not be stored."""
+        with self._lock:
+            if appointment_id in self._appointments:
+                self._appointments.discard(appointment_id)
+                self.counters["released"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "appointments": len(self._appointments),
+                "rebuilt": dict(self.rebuilt),
+                **self.counters
+            }
+
+
+booked_appointments = AppointmentIdIndex()
@@ -0,0 +1,146 @@
+"""In-process view of doctor slot loads, kept in step with local bookings.
+
+`recommend_available_doctors_with_visit_reason_summary` answers with each
+doctor's open dates, time slots and current appointment load. Every
+answer updates the loads kept here per (doctor, date, time slot):
+
+- Each booking made here bumps the slot's load right away. A slot's load
+  is the last remote value plus the bookings made since that value was
+  requested, so a newer answer does not lose bookings the endpoint has not
+  counted yet.
+- Slots at AVAILABILITY_SLOT_CAPACITY are removed from every list passed
+  through `apply`, and `reserve` refuses them.
+
+Only loads are kept. The answer's grouped_text is specific to the patient
+it was requested for, so the recommendation itself is requested for every
+patient and never served from here.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Slots untouched by any answer or booking for this long are forgotten.
+AVAILABILITY_MAX_AGE = float(os.getenv("AVAILABILITY_MAX_AGE", "900"))
+# Appointments one doctor can take in one time slot on one date.
+AVAILABILITY_SLOT_CAPACITY = int(os.getenv("AVAILABILITY_SLOT_CAPACITY", "50"))
+
+
+def _slot_key(doctor_id, date, time_slot):
+    return (str(doctor_id), str(date).strip(), str(time_slot).strip())
+
+
+class _Slot:
+    __slots__ = ("remote_load", "fetched_at", "bookings")
+
+    def __init__(self):
+        self.remote_load = 0
+        self.fetched_at = float("-inf")
+        self.bookings = []
+
+    def load(self):
+        return self.remote_load + len(self.bookings)
+
+
+class AvailabilityIndex:
+    def __init__(self, max_age=AVAILABILITY_MAX_AGE, capacity=AVAILABILITY_SLOT_CAPACITY):
+        self.max_age = max_age
+        self.capacity = capacity
+        self._slots = {}
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {"answers": 0, "bookings": 0, "rejected": 0}
+
+    def _is_full(self, slot):
+        return slot is not None and slot.load() >= self.capacity
+
+    def _prune_slots(self, now):
+        # Forget slots that no recent answer or booking has touched.
+        if now - self._pruned_at < self.max_age:
+            return
+        self._pruned_at = now
+        cutoff = now - self.max_age
+        for slot_key in [k for k, slot in self._slots.items() if max([slot.fetched_at, *slot.bookings]) < cutoff]:
+            del self._slots[slot_key]
+
+    def apply(self, final_dr_list):
+        """Copy of `final_dr_list` with local loads applied and full slots removed."""
+        with self._lock:
+            doctors = []
+            for doctor in final_dr_list:
+                dates = []
+                for available in doctor.get('Available_Dates') or []:
+                    slot = self._slots.get(_slot_key(doctor.get('Doctor_ID'), available.get('Available_Date'),
+                                                     available.get('Time_Slot')))
+                    if self._is_full(slot):
+                        continue
+                    available = dict(available)
+                    if slot is not None:
+                        available['Appointment_Load'] = slot.load()
+                    dates.append(available)
+                if dates:
+                    doctors.append({**doctor, 'Available_Dates': dates})
+            return doctors
+
+    def populate(self, final_dr_list, requested_at):
+        """Record the loads in an endpoint answer; `requested_at` is when the request went out (time.monotonic())."""
+        with self._lock:
+            self.counters["answers"] += 1
+            self._prune_slots(time.monotonic())
+            for doctor in final_dr_list:
+                for available in doctor.get('Available_Dates') or []:
+                    slot_key = _slot_key(doctor.get('Doctor_ID'), available.get('Available_Date'),
+                                         available.get('Time_Slot'))
+                    slot = self._slots.get(slot_key)
+                    if slot is None:
+                        slot = self._slots[slot_key] = _Slot()
+                    if requested_at < slot.fetched_at:
+                        continue
+                    slot.remote_load = int(available.get('Appointment_Load') or 0)
+                    slot.fetched_at = requested_at
+                    slot.bookings = [booked_at for booked_at in slot.bookings if booked_at >= requested_at]
+
+    def reserve(self, doctor_id, date, time_slot):
+        """Count a booking against the slot; False (and nothing counted) if it is full."""
+        slot_key = _slot_key(doctor_id, date, time_slot)
+        with self._lock:
+            slot = self._slots.get(slot_key)
+            if slot is None:
+                slot = self._slots[slot_key] = _Slot()
+            if self._is_full(slot):
+                self.counters["rejected"] += 1
+                return False
+            slot.bookings.append(time.monotonic())
+            self.counters["bookings"] += 1
+            return True
+
+    def release(self, doctor_id, date, time_slot):
+        """Undo the latest `reserve` of the slot, for a booking that could not be saved."""
+        with self._lock:
+            slot = self._slots.get(_slot_key(doctor_id, date, time_slot))
+            if slot is not None and slot.bookings:
+                slot.bookings.pop()
+                self.counters["bookings"] -= 1
+
+    def is_full(self, doctor_id, date, time_slot):
+        with self._lock:
+            return self._is_full(self._slots.get(_slot_key(doctor_id, date, time_slot)))
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": len(self._slots),
+                "full_slots": sum(1 for slot in self._slots.values() if self._is_full(slot)),
+                "max_age": self.max_age,
+                "capacity": self.capacity,
+                **self.counters
+            }
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,324 @@
+"""Local stand-ins for the services the chatbot talks to.
+
+- `FakeDatabricksServer`: HTTP server answering every task with canned
+  predictions shaped like input_json_AS, after a configurable delay.
+- `FakeBlobServiceClient`: in-memory block blob store with ETag checks,
+  enough for booking_store's appenders and partition reads.
+- `FakeSMTPServer`: accepts and discards mail, counting messages.
+"""
+import json
+import random
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from input_json_AS import AS_input_json
+
+
+class Latency:
+    """Delay distribution parsed from a spec string.
+
+    "const:0.2", "uniform:0.1,0.4" or "lognormal:0.3,0.5" (median seconds,
+    sigma). A bare number means const.
+    """
+
+    def __init__(self, spec="const:0"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        if not args:
+            kind, args = "const", kind
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",")]
+        if kind not in ("const", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng=random):
+        if self.kind == "const":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        median, sigma = self.args
+        return median * rng.lognormvariate(0, sigma) if median > 0 else 0.0
+
+
+def canned_predictions(inputs):
+    """Predictions for a task, shaped like the production responses."""
+    task = inputs.get("task")
+    sample = AS_input_json
+    if task == "get_followup_questions":
+        return {"followup_questions": ["How long have you had these symptoms?", "Is there any pain?"]}
+    if task == "summarize_symptom":
+        return {"summary": sample["summary"]}
+    if task == "map_to_department":
+        # One department keeps the scripted conversation on the direct path.
+        return {"departments": sample["departments"][:1]}
+    if task == "find_nearest_branches":
+        return {"branches": sample["branches"]}
+    if task == "validate_appointment_date":
+        return {"valid": True}
+    if task == "recommend_available_doctors_with_visit_reason_summary":
+        return {"final_dr_list": sample["final_dr_list"], "grouped_text": sample["grouped_text"]}
+    if task == "llm_maps_to_similar_cases":
+        return {"doctor_ids_ordered": sample["doctor_ids_ordered"], "raw_text": sample["raw_text"]}
+    if task == "top3_and_blocks":
+        return {"recommended_doctors": sample["recommended_doctors"]}
+    return None
+
+
+class _DatabricksHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        inputs = json.loads(body).get("inputs", {})
+        task = inputs.get("task")
+        self.server.count(task)
+        time.sleep(self.server.latency_for(task).sample())
+        predictions = canned_predictions(inputs)
+        status = 200 if predictions is not None else 400
+        payload = {"predictions": predictions} if predictions is not None else {"error_code": "BAD_REQUEST"}
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # GET /stats reports calls per task, for runs where the server lives in another process.
+        with self.server._calls_lock:
+            data = json.dumps(self.server.calls).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDatabricksServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency="const:0", task_latency=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _DatabricksHandler)
+        self.latency = Latency(latency)
+        self.task_latency = {task: Latency(spec) for task, spec in (task_latency or {}).items()}
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/serving-endpoints/appointment-scheduler/invocations"
+
+    def latency_for(self, task):
+        return self.task_latency.get(task, self.latency)
+
+    def count(self, task):
+        with self._calls_lock:
+            self.calls[task] = self.calls.get(task, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-databricks", daemon=True).start()
+        return self
+
+
+def serve_databricks(conn, latency="const:0", task_latency=None):
+    """Process entry point: send the server's URL back over `conn`, then serve."""
+    server = FakeDatabricksServer(latency, task_latency)
+    conn.send(server.url)
+    conn.close()
+    server.serve_forever()
+
+
+def _http_error(cls, status):
+    return cls(f"HTTP {status}", response=SimpleNamespace(status_code=status, reason="", headers={}, text=lambda: ""))
+
+
+class _Blob:
+    def __init__(self, blob_type="BlockBlob"):
+        self.blob_type = blob_type
+        self.blocks = []
+        self.staged = {}
+        self.etag = None
+
+
+class FakeBlobClient:
+    def __init__(self, service, name):
+        self.service = service
+        self.blob_name = name
+
+    def _blob(self):
+        blob = self.service.blobs.get(self.blob_name)
+        if blob is None or blob.etag is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        return blob
+
+    def _delay(self):
+        time.sleep(self.service.latency.sample())
+
+    def exists(self):
+        self._delay()
+        with self.service.lock:
+            blob = self.service.blobs.get(self.blob_name)
+            return blob is not None and blob.etag is not None
+
+    def get_blob_properties(self):
+        self._delay()
+        with self.service.lock:
+            blob = self._blob()
+            return SimpleNamespace(
+                etag=blob.etag, size=sum(len(data) for _, data in blob.blocks), blob_type=blob.blob_type, metadata={},
+                append_blob_committed_block_count=len(blob.blocks) if blob.blob_type == "AppendBlob" else None
+            )
+
+    def get_block_list(self, block_list_type="committed"):
+        self._delay()
+        with self.service.lock:
+            return [SimpleNamespace(id=block_id) for block_id, _ in self._blob().blocks], []
+
+    def stage_block(self, block_id, data):
+        self._delay()
+        with self.service.lock:
+            self.service.blobs.setdefault(self.blob_name, _Blob()).staged[block_id] = bytes(data)
+
+    def commit_block_list(self, block_list, etag=None, match_condition=None):
+        self._delay()
+        with self.service.lock:
+            blob = self.service.blobs.setdefault(self.blob_name, _Blob())
+            if match_condition == MatchConditions.IfMissing and blob.etag is not None:
+                raise _http_error(ResourceExistsError, 409)
+            if match_condition == MatchConditions.IfNotModified and blob.etag != etag:
+                raise _http_error(ResourceModifiedError, 412)
+            committed = dict(blob.blocks)
+            blob.blocks = [
+                (block.id, blob.staged.pop(block.id) if block.id in blob.staged else committed[block.id])
+                for block in block_list
+            ]
+            blob.etag = uuid.uuid4().hex
+            return {"etag": blob.etag}
+
+    def create_append_blob(self, metadata=None, etag=None, match_condition=None, **kwargs):
+        self._delay()
+        with self.service.lock:
+            blob = self.service.blobs.get(self.blob_name)
+            if match_condition == MatchConditions.IfMissing and blob is not None and blob.etag is not None:
+                raise _http_error(ResourceExistsError, 409)
+            blob = self.service.blobs[self.blob_name] = _Blob("AppendBlob")
+            blob.etag = uuid.uuid4().hex
+
+    def append_block(self, data, appendpos_condition=None, **kwargs):
+        self._delay()
+        with self.service.lock:
+            blob = self._blob()
+            if blob.blob_type != "AppendBlob":
+                raise _http_error(ResourceExistsError, 409)
+            if appendpos_condition is not None and appendpos_condition != sum(len(d) for _, d in blob.blocks):
+                raise _http_error(ResourceModifiedError, 412)
+            blob.blocks.append((uuid.uuid4().hex, bytes(data)))
+            blob.etag = uuid.uuid4().hex
+            return {"etag": blob.etag, "blob_committed_block_count": len(blob.blocks)}
+
+    def upload_blob(self, data, overwrite=False):
+        self._delay()
+        with self.service.lock:
+            blob = self.service.blobs.setdefault(self.blob_name, _Blob())
+            blob.blocks = [(uuid.uuid4().hex, bytes(data))]
+            blob.etag = uuid.uuid4().hex
+
+    def download_blob(self, etag=None, match_condition=None, **kwargs):
+        self._delay()
+        with self.service.lock:
+            blob = self._blob()
+            if match_condition == MatchConditions.IfNotModified and blob.etag != etag:
+                raise _http_error(ResourceModifiedError, 412)
+            data = b"".join(data for _, data in blob.blocks)
+        return SimpleNamespace(readall=lambda: data, chunks=lambda: iter([data]))
+
+    def content(self):
+        with self.service.lock:
+            blob = self.service.blobs.get(self.blob_name)
+            return b"".join(data for _, data in blob.blocks) if blob else b""
+
+
+class _FakeContainerClient:
+    def __init__(self, service):
+        self.service = service
+
+    def exists(self):
+        time.sleep(self.service.latency.sample())
+        return True
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self.service, name)
+
+    def list_blobs(self, name_starts_with=""):
+        with self.service.lock:
+            names = sorted(name for name, blob in self.service.blobs.items()
+                           if name.startswith(name_starts_with) and blob.etag is not None)
+        return [SimpleNamespace(name=name) for name in names]
+
+
+class FakeBlobServiceClient:
+    def __init__(self, latency="const:0"):
+        self.latency = Latency(latency)
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def get_container_client(self, name):
+        return _FakeContainerClient(self)
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        self._reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith("EHLO"):
+                self._reply("250-fake")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif command.startswith("AUTH"):
+                self._reply("235 Authentication successful")
+            elif command.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.count()
+                self._reply("250 Queued")
+            elif command.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.sent = 0
+        self._sent_lock = threading.Lock()
+
+    def count(self):
+        with self._sent_lock:
+            self.sent += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-smtp", daemon=True).start()
+        return self
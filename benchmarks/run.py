@@ -0,0 +1,432 @@
+"""End-to-end load benchmark against local fakes.
+
+Drives complete conversations (/start, then /chatbot from ask_name to end)
+through the app in-process at a fixed concurrency. The serving endpoint is
+faked in a child process with configurable latency, and blob storage and
+SMTP are faked locally, so no production service is touched.
+
+    python -m benchmarks.run --conversations 200 --concurrency 50 \\
+        --latency lognormal:0.2,0.5 --task-latency top3_and_blocks=lognormal:1,0.3 \\
+        --save-baseline default
+
+    python -m benchmarks.run --conversations 200 --concurrency 50 \\
+        --latency lognormal:0.2,0.5 --task-latency top3_and_blocks=lognormal:1,0.3 \\
+        --compare default
+
+Reports p50/p95/p99 turn latency, bookings per second, peak RSS, memory
+per stored conversation and how busy the worker threadpool got. Cold start
+is measured first: `import main` in a fresh interpreter, the /ready
+warm-up (skipped with --skip-ready) and one conversation on its own before
+the load starts. `--compare` exits with status 1 when a
+metric is worse than the baseline by more than `--tolerance`.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import date, timedelta
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, "baselines")
+
+# metric path -> True when higher is better
+COMPARED_METRICS = {
+    "turn_latency_ms.p50": False,
+    "turn_latency_ms.p95": False,
+    "turn_latency_ms.p99": False,
+    "bookings_per_sec": True,
+    "peak_rss_mb": False,
+    "conversation_memory_kb.typed": False,
+    "cold_start.import_s": False,
+    "cold_start.first_conversation_ms": False,
+}
+
+
+def conversation_script():
+    """User inputs for one conversation, ask_name through select_doctor."""
+    appointment_date = (date.today() + timedelta(days=3)).isoformat()
+    return [
+        "Asha", "29", "asha@example.com", "Female", "500081",
+        "irregular periods and cramps", "two months", "mild pain",
+        "yes", appointment_date, "proceed", "1",
+    ]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values_ms):
+    values = sorted(values_ms)
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else None,
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def deep_sizeof(obj, seen):
+    """Bytes reachable from `obj` through containers and slots, skipping objects already in `seen`."""
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    else:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+def conversation_memory_kb(store):
+    """Average size of the stored conversations, as kept and as the plain dicts they replace.
+
+    Objects shared between conversations, such as interned records and strings,
+    are counted once across the whole store.
+    """
+    states = [state for state, _ in getattr(store, "_items", {}).values()]
+    if not states:
+        return None
+    typed_seen, dict_seen = set(), set()
+    typed = sum(deep_sizeof(state, typed_seen) for state in states)
+    # A JSON round trip gives each conversation its own records, as the old dict states had.
+    dicts = [json.loads(json.dumps(state.to_dict())) for state in states]
+    as_dicts = sum(deep_sizeof(state, dict_seen) for state in dicts)
+    return {"conversations": len(states), "typed": typed / len(states) / 1024, "dicts": as_dicts / len(states) / 1024}
+
+
+def measure_import_seconds(runs=3):
+    """Median wall time of `import main` in a fresh interpreter."""
+    code = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(BENCHMARK_DIR),
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+async def cold_start(app, skip_ready):
+    """Warm the app up through /ready (unless skipped), then time one conversation on its own."""
+    import httpx
+    ready_ms = None
+    if not skip_ready:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            started = time.perf_counter()
+            response = await client.get("/ready")
+            ready_ms = (time.perf_counter() - started) * 1000
+            response.raise_for_status()
+    turn_ms, _, outcome, _ = await drive(app, 1, 1)
+    if outcome["failed"]:
+        raise RuntimeError(f"cold start conversation failed: {outcome['errors']}")
+    return {
+        "ready_ms": ready_ms,
+        "first_turn_ms": turn_ms[0],
+        "first_conversation_ms": sum(turn_ms),
+    }
+
+
+def start_fake_databricks(latency, task_latency):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    from benchmarks.fakes import serve_databricks
+    process = ctx.Process(target=serve_databricks, args=(child, latency, task_latency), daemon=True)
+    process.start()
+    url = parent.recv()
+    return process, url
+
+
+class ThreadpoolSampler:
+    """Samples the anyio worker-thread limiter and the flow stage executor."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.saturated = 0
+        self.max_busy = 0
+        self.max_waiting = 0
+        self.max_stage_queued = 0
+        self.size = None
+
+    async def run(self):
+        import anyio.to_thread
+        import flows
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        self.size = limiter.total_tokens
+        while True:
+            busy = limiter.borrowed_tokens
+            waiting = limiter.statistics().tasks_waiting
+            self.samples += 1
+            self.saturated += busy >= limiter.total_tokens
+            self.max_busy = max(self.max_busy, busy)
+            self.max_waiting = max(self.max_waiting, waiting)
+            if flows._executor is not None:
+                self.max_stage_queued = max(self.max_stage_queued, flows._executor._work_queue.qsize())
+            await asyncio.sleep(self.interval)
+
+    def report(self):
+        return {
+            "size": self.size,
+            "max_busy": self.max_busy,
+            "saturated_pct": 100.0 * self.saturated / self.samples if self.samples else 0.0,
+            "max_waiting": self.max_waiting,
+            "stage_executor_max_queued": self.max_stage_queued,
+        }
+
+
+async def drive(app, n_conversations, concurrency):
+    import httpx
+    script = conversation_script()
+    turn_ms = []
+    by_state = {}
+    token_bytes = []
+    outcome = {"completed": 0, "failed": 0, "errors": []}
+    remaining = iter(range(n_conversations))
+
+    async def one_conversation(client):
+        response = await client.post("/start")
+        response.raise_for_status()
+        conversation_id = response.json()["conversation_id"]
+        # Set in stateless mode; sent back on every turn.
+        state_token = response.json().get("state_token")
+        state = "ask_name"
+        for user_input in script:
+            started = time.perf_counter()
+            response = await client.post("/chatbot", json={
+                "conversation_id": conversation_id, "user_input": user_input, "state_token": state_token})
+            elapsed = (time.perf_counter() - started) * 1000
+            response.raise_for_status()
+            turn_ms.append(elapsed)
+            by_state.setdefault(state, []).append(elapsed)
+            state = response.json()["state"]
+            state_token = response.json().get("state_token")
+            if state_token:
+                token_bytes.append(len(state_token))
+        if state != "end":
+            raise RuntimeError(f"conversation stopped in state {state}")
+
+    async def worker(client):
+        for _ in remaining:
+            try:
+                await one_conversation(client)
+                outcome["completed"] += 1
+            except Exception as e:
+                outcome["failed"] += 1
+                if len(outcome["errors"]) < 5:
+                    outcome["errors"].append(repr(e))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+    outcome["max_state_token_bytes"] = max(token_bytes, default=None)
+    return turn_ms, by_state, outcome, duration
+
+
+async def run_benchmark(args, databricks_url, blob_service, smtp_server):
+    import main
+    from booking_store import get_booking_writer
+    get_booking_writer(blob_service)
+
+    sampler = ThreadpoolSampler()
+    async with main.lifespan(main.app):
+        cold = await cold_start(main.app, args.skip_ready)
+        cold["import_s"] = args.import_seconds
+        sampling = asyncio.ensure_future(sampler.run())
+        try:
+            turn_ms, by_state, outcome, duration = await drive(main.app, args.conversations, args.concurrency)
+        finally:
+            sampling.cancel()
+        memory = conversation_memory_kb(main.conversations)
+    # lifespan shutdown drained the booking writer and the email queue.
+    return {
+        "config": {
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "mode": "async" if main.CHATBOT_ASYNC else "sync",
+            "latency": args.latency,
+            "task_latency": dict(args.task_latency),
+            "blob_latency": args.blob_latency,
+            "ready": not args.skip_ready,
+            "stateless": args.stateless,
+        },
+        "completed": outcome["completed"],
+        "failed": outcome["failed"],
+        "errors": outcome["errors"],
+        "duration_s": duration,
+        "turns": len(turn_ms),
+        "turn_latency_ms": summarize(turn_ms),
+        "turn_latency_by_state_ms": {state: summarize(values) for state, values in by_state.items()},
+        "bookings_per_sec": outcome["completed"] / duration if duration else 0.0,
+        "emails_sent": smtp_server.sent,
+        "peak_rss_mb": peak_rss_mb(),
+        "conversation_memory_kb": memory,
+        "threadpool": sampler.report(),
+        "max_state_token_bytes": outcome["max_state_token_bytes"],
+        "cold_start": cold,
+        "databricks_calls": fetch_databricks_calls(databricks_url),
+    }
+
+
+def fetch_databricks_calls(url):
+    import requests
+    stats_url = url.split("/serving-endpoints", 1)[0] + "/stats"
+    try:
+        return requests.get(stats_url, timeout=5).json()
+    except requests.RequestException:
+        return None
+
+
+def lookup(result, path):
+    value = result
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(result, baseline, tolerance):
+    """Print a comparison table; returns the metrics that regressed."""
+    regressions = []
+    if baseline.get("config") != result["config"]:
+        print("warning: baseline was recorded with a different configuration")
+    print(f"{'metric':<34}{'baseline':>12}{'current':>12}{'change':>10}")
+    for path, higher_is_better in COMPARED_METRICS.items():
+        old, new = lookup(baseline, path), lookup(result, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(path)
+        print(f"{path:<34}{old:>12.2f}{new:>12.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def print_report(result):
+    latency = result["turn_latency_ms"]
+    pool = result["threadpool"]
+    print(f"conversations: {result['completed']} completed, {result['failed']} failed in {result['duration_s']:.2f}s")
+    for error in result["errors"]:
+        print(f"  error: {error}")
+    if not result["turns"]:
+        return
+    cold = result["cold_start"]
+    ready = f"{cold['ready_ms']:.1f} ms" if cold["ready_ms"] is not None else "skipped"
+    print(f"cold start: import {cold['import_s'] * 1000:.0f} ms, /ready {ready}, "
+          f"first turn {cold['first_turn_ms']:.1f} ms, first conversation {cold['first_conversation_ms']:.1f} ms")
+    print(f"turn latency ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    print(f"bookings/sec: {result['bookings_per_sec']:.2f}  emails sent: {result['emails_sent']}")
+    print(f"peak RSS: {result['peak_rss_mb']:.1f} MB")
+    memory = result["conversation_memory_kb"]
+    if memory:
+        print(f"memory per conversation: {memory['typed']:.1f} KB ({memory['dicts']:.1f} KB as plain dicts, "
+              f"{memory['conversations']} stored)")
+    if result["max_state_token_bytes"]:
+        print(f"largest state token: {result['max_state_token_bytes']} bytes")
+    print(f"threadpool: {pool['max_busy']}/{pool['size']} max busy, saturated {pool['saturated_pct']:.1f}% of samples, "
+          f"max waiting {pool['max_waiting']}, stage executor max queued {pool['stage_executor_max_queued']}")
+    print("slowest states by p95 ms:")
+    states = sorted(result["turn_latency_by_state_ms"].items(), key=lambda item: item[1]["p95"], reverse=True)
+    for state, summary in states[:5]:
+        print(f"  {state:<24}{summary['p95']:>10.1f}")
+
+
+def parse_task_latency(values):
+    specs = {}
+    for value in values:
+        task, _, spec = value.partition("=")
+        specs[task] = spec
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end load benchmark")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", default="lognormal:0.2,0.5",
+                        help="serving latency: const:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--task-latency", action="append", default=[], metavar="TASK=SPEC",
+                        help="per-task latency override; may be repeated")
+    parser.add_argument("--blob-latency", default="const:0.02", help="latency of each blob storage call")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async", help="sets CHATBOT_ASYNC")
+    parser.add_argument("--skip-ready", action="store_true", help="start the first conversation without calling /ready")
+    parser.add_argument("--stateless", action="store_true", help="carry conversation state in signed tokens")
+    parser.add_argument("--output", help="write the full result as JSON to this path")
+    parser.add_argument("--save-baseline", metavar="NAME", help="store the result as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+    args.task_latency = parse_task_latency(args.task_latency)
+
+    process, databricks_url = start_fake_databricks(args.latency, args.task_latency)
+    from benchmarks.fakes import FakeBlobServiceClient, FakeSMTPServer
+    smtp_server = FakeSMTPServer().start()
+    os.environ.update({
+        "DATABRICKS_ENDPOINT": databricks_url,
+        "SMTP_HOST": smtp_server.server_address[0],
+        "SMTP_PORT": str(smtp_server.server_address[1]),
+        "SMTP_STARTTLS": "false",
+        "CHATBOT_ASYNC": "true" if args.mode == "async" else "false",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.stateless:
+        os.environ.update({"STATELESS_MODE": "true", "STATE_TOKEN_SECRET": "benchmark"})
+    # Every conversation books the same canned slots, which would otherwise fill up after a few runs.
+    os.environ.setdefault("AVAILABILITY_SLOT_CAPACITY", str(10 ** 9))
+    os.environ.setdefault("BOOKING_WAL_DIR", tempfile.mkdtemp(prefix="benchmark-wal-"))
+
+    args.import_seconds = measure_import_seconds()
+    try:
+        result = asyncio.run(run_benchmark(args, databricks_url, FakeBlobServiceClient(args.blob_latency), smtp_server))
+    finally:
+        process.terminate()
+        smtp_server.shutdown()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved baseline {path}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,623 @@
+"""Append-only persistence of bookings to Azure Blob Storage.
+
+Partition rows are added to a block blob by staging a new block and
+committing the block list with an ETag precondition, so a booking costs one
+small upload instead of a download and rewrite of the whole history, and
+concurrent writers retry instead of overwriting each other. The legacy CSV
+is an append blob, where a batch is a single Append Block call however long
+the history is.
+
+Bookings are partitioned by Selected_Date (and by branch unless
+BOOKING_PARTITION_BY_BRANCH=false) into NDJSON blobs:
+
+    {BOOKING_PARTITION_PREFIX}/date=2025-06-03/branch=kukatpally.ndjson
+
+so a query reads only the partitions for the dates (and branch) it asks
+for. The default, BOOKING_STORAGE=both, writes partitions and mirrors
+each batch to the legacy CSV blob, so consumers of the CSV keep working.
+Until the CSV has been converted with
+
+    python booking_store.py migrate
+
+reads come from the CSV (plus any partition rows it is missing), so no
+booking made before the switch is overlooked. BOOKING_STORAGE=partitioned
+drops the CSV once nothing reads it, and BOOKING_STORAGE=csv keeps only
+the CSV.
+
+The Azure SDK is imported on first use rather than with this module, so
+importing the app stays fast; `warm_up_booking_store` loads it and opens
+the storage connection ahead of the first booking.
+"""
+import argparse
+import codecs
+import csv
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import date, timedelta
+from io import StringIO
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+BLOB_CONN_STR = os.getenv("BLOB_CONN_STR", "DefaultEndpointsProtocol=https;AccountName=aitoolschatbotssa;AccountKey=wRiWLbBUPKodq8CTuhe4FeItgqdWZ45+DJZKNWY6FBeFbMBpvmZLb5W9FolclFZy6QKnrKcPP9lr+AStCnPrGQ==;EndpointSuffix=core.windows.net")
+BLOB_CONTAINER = os.getenv("BLOB_CONTAINER", "appointment")
+BLOB_CSV_PATH = os.getenv("BLOB_CSV_PATH", "appointments_saved_bookings.csv/appointments")
+BOOKING_STORAGE = os.getenv("BOOKING_STORAGE", "both").lower()
+BOOKING_PARTITION_PREFIX = os.getenv("BOOKING_PARTITION_PREFIX", "bookings")
+BOOKING_PARTITION_BY_BRANCH = os.getenv("BOOKING_PARTITION_BY_BRANCH", "true").lower() in ("1", "true", "yes")
+# Longest date range one query may cover.
+BOOKING_QUERY_MAX_DAYS = int(os.getenv("BOOKING_QUERY_MAX_DAYS", "366"))
+# Written next to the partitions once the legacy CSV has been migrated.
+MIGRATION_MARKER = "_migrated_from_csv"
+
+# Most bookings written in one block; a batch forms from bookings that arrive while a flush is in progress.
+BOOKING_BATCH_MAX = int(os.getenv("BOOKING_BATCH_MAX", "50"))
+# Extra time to wait for more bookings before flushing a batch. 0 flushes as soon as the writer is free.
+BOOKING_BATCH_LINGER_MS = float(os.getenv("BOOKING_BATCH_LINGER_MS", "0"))
+BOOKING_COMMIT_ATTEMPTS = int(os.getenv("BOOKING_COMMIT_ATTEMPTS", "10"))
+
+# Azure allows at most 50,000 committed blocks per blob; compact before reaching it.
+MAX_COMMITTED_BLOCKS = 49000
+BLOCK_ID_LENGTH = 32
+# Largest single Append Block upload, used when copying content into an append blob.
+APPEND_BLOCK_MAX_BYTES = 4 * 1024 * 1024
+# Metadata on an append blob being rewritten from a snapshot (conversion or compaction).
+REWRITE_STATE_KEY = "rewrite"
+REWRITE_SOURCE_KEY = "rewrite_source_snapshot"
+
+
+class BookingWriteConflict(Exception):
+    """The blob kept changing under us and the append could not be committed."""
+
+
+def _new_block_id():
+    return uuid.uuid4().hex
+
+
+def _is_conflict(error):
+    from azure.core.exceptions import HttpResponseError
+    return isinstance(error, HttpResponseError) and error.status_code in (409, 412)
+
+
+class BlockBlobAppender:
+    """Append bytes to a block blob with optimistic concurrency.
+
+    Each append stages one block and commits `committed blocks + new block`
+    only if the blob's ETag is unchanged since the block list was read. A
+    blob created by a single Put Blob has no block list, so its content is
+    re-staged as one block the first time it is appended to; the same
+    one-off rewrite compacts the blob before it hits the block limit.
+    """
+
+    def __init__(self, blob_client, max_attempts=BOOKING_COMMIT_ATTEMPTS):
+        self.blob = blob_client
+        self.max_attempts = max_attempts
+
+    def _committed_blocks(self, etag, size):
+        from azure.core import MatchConditions
+        committed, _ = self.blob.get_block_list("committed")
+        block_ids = [block.id for block in committed]
+        needs_rebase = size > 0 and (
+            not block_ids
+            or len(block_ids) >= MAX_COMMITTED_BLOCKS
+            or any(len(block_id) != BLOCK_ID_LENGTH for block_id in block_ids)
+        )
+        if needs_rebase:
+            logger.info("Rebasing %s (%s bytes, %s blocks) into one block", self.blob.blob_name, size, len(block_ids))
+            content = self.blob.download_blob(etag=etag, match_condition=MatchConditions.IfNotModified).readall()
+            base_id = _new_block_id()
+            self.blob.stage_block(base_id, content)
+            block_ids = [base_id]
+        return block_ids
+
+    def append(self, data: bytes, header: bytes = b""):
+        """Append `data`, writing `header` first if the blob does not exist yet."""
+        from azure.core import MatchConditions
+        from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+        from azure.storage.blob import BlobBlock, BlockState
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                try:
+                    props = self.blob.get_blob_properties()
+                except ResourceNotFoundError:
+                    props = None
+                block_id = _new_block_id()
+                if props is None:
+                    self.blob.stage_block(block_id, header + data)
+                    self.blob.commit_block_list(
+                        [BlobBlock(block_id=block_id)],
+                        etag="*", match_condition=MatchConditions.IfMissing
+                    )
+                else:
+                    block_ids = self._committed_blocks(props.etag, props.size)
+                    self.blob.stage_block(block_id, data)
+                    block_list = [BlobBlock(block_id=i, state=BlockState.COMMITTED) for i in block_ids]
+                    block_list.append(BlobBlock(block_id=block_id))
+                    self.blob.commit_block_list(
+                        block_list,
+                        etag=props.etag, match_condition=MatchConditions.IfNotModified
+                    )
+                return
+            except HttpResponseError as e:
+                if not _is_conflict(e):
+                    raise
+                logger.debug("Blob %s changed during append (attempt %s), retrying", self.blob.blob_name, attempt)
+                time.sleep(random.uniform(0, 0.05 * attempt))
+        raise BookingWriteConflict(f"Could not append to {self.blob.blob_name} after {self.max_attempts} attempts")
+
+
+def _rechunk(chunks, size):
+    """Regroup a stream of byte chunks into pieces of at most `size` bytes."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        while len(pending) >= size:
+            yield pending[:size]
+            pending = pending[size:]
+    if pending:
+        yield pending
+
+
+class AppendBlobAppender:
+    """Append bytes to an append blob: one Append Block call per batch.
+
+    The blob's header is written once, by whichever writer wins the
+    append-position-0 condition. A block blob at the path (the CSV as
+    earlier versions wrote it), or an append blob close to the block limit,
+    is rewritten once: under a lease it is snapshotted, recreated as an
+    append blob and its content appended back in large blocks. The snapshot
+    is kept as a backup, and a rewrite cut short is redone from it.
+    """
+
+    def __init__(self, blob_client, max_attempts=BOOKING_COMMIT_ATTEMPTS):
+        self.blob = blob_client
+        self.max_attempts = max_attempts
+        self._ready = False
+
+    def _rewrite(self, props):
+        lease = self.blob.acquire_lease(lease_duration=60)
+        try:
+            metadata = props.metadata or {}
+            if metadata.get(REWRITE_STATE_KEY) == "in_progress":
+                snapshot = metadata[REWRITE_SOURCE_KEY]
+            else:
+                snapshot = self.blob.create_snapshot(lease=lease)["snapshot"]
+            logger.info("Rewriting %s as an append blob from snapshot %s", self.blob.blob_name, snapshot)
+            source = type(self.blob).from_blob_url(self.blob.url, credential=self.blob.credential, snapshot=snapshot)
+            self.blob.create_append_blob(
+                metadata={REWRITE_STATE_KEY: "in_progress", REWRITE_SOURCE_KEY: snapshot}, lease=lease
+            )
+            for chunk in _rechunk(source.download_blob().chunks(), APPEND_BLOCK_MAX_BYTES):
+                self.blob.append_block(chunk, lease=lease)
+                lease.renew()
+            self.blob.set_blob_metadata({REWRITE_SOURCE_KEY: snapshot}, lease=lease)
+        finally:
+            lease.release()
+
+    def _prepare(self, header):
+        """Make sure the blob is an append blob with room left that starts with `header`."""
+        from azure.core import MatchConditions
+        from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+        from azure.storage.blob import BlobType
+        try:
+            props = self.blob.get_blob_properties()
+        except ResourceNotFoundError:
+            try:
+                self.blob.create_append_blob(etag="*", match_condition=MatchConditions.IfMissing)
+            except ResourceExistsError:
+                pass
+            props = self.blob.get_blob_properties()
+        if (props.blob_type != BlobType.APPENDBLOB
+                or (props.metadata or {}).get(REWRITE_STATE_KEY) == "in_progress"
+                or (props.append_blob_committed_block_count or 0) >= MAX_COMMITTED_BLOCKS):
+            self._rewrite(props)
+            props = self.blob.get_blob_properties()
+        if props.size == 0:
+            try:
+                self.blob.append_block(header, appendpos_condition=0)
+            except Exception as e:
+                # Another writer put the header in first.
+                if not _is_conflict(e):
+                    raise
+        self._ready = True
+
+    def append(self, data: bytes, header: bytes = b""):
+        """Append `data`, writing `header` first if the blob is new."""
+        from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if not self._ready:
+                    self._prepare(header)
+                result = self.blob.append_block(data)
+                if int(result.get("blob_committed_block_count") or 0) >= MAX_COMMITTED_BLOCKS:
+                    self._ready = False
+                return
+            except HttpResponseError as e:
+                # Leased for a rewrite, deleted or replaced: look at the blob again before retrying.
+                if not _is_conflict(e) and not isinstance(e, ResourceNotFoundError):
+                    raise
+                self._ready = False
+                logger.debug("Blob %s not appendable (attempt %s), retrying", self.blob.blob_name, attempt)
+                time.sleep(random.uniform(0, 0.05 * attempt))
+        raise BookingWriteConflict(f"Could not append to {self.blob.blob_name} after {self.max_attempts} attempts")
+
+
+def encode_rows(rows):
+    """Render booking dicts as CSV lines and the header for a new file."""
+    output = StringIO()
+    for row in rows:
+        csv.DictWriter(output, fieldnames=list(row.keys())).writerow(row)
+    header = StringIO()
+    csv.DictWriter(header, fieldnames=list(rows[0].keys())).writeheader()
+    return output.getvalue().encode("utf-8"), header.getvalue().encode("utf-8")
+
+
+def _iter_lines(chunks):
+    """Decode a stream of UTF-8 chunks into lines (line endings kept), one chunk at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_rows(blob_client):
+    """Stream booking rows (dicts keyed by the CSV header) from the blob, oldest first."""
+    from azure.core.exceptions import ResourceNotFoundError
+    try:
+        downloader = blob_client.download_blob()
+    except ResourceNotFoundError:
+        return
+    yield from csv.DictReader(_iter_lines(downloader.chunks()))
+
+
+def branch_slug(branch):
+    return re.sub(r"[^a-z0-9]+", "-", str(branch).lower()).strip("-") or "unknown"
+
+
+def date_range(date_from, date_to):
+    """ISO dates from `date_from` to `date_to` inclusive; raises ValueError on bad input."""
+    start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    if end < start:
+        raise ValueError("date_to is before date_from")
+    if (end - start).days >= BOOKING_QUERY_MAX_DAYS:
+        raise ValueError(f"date range is longer than {BOOKING_QUERY_MAX_DAYS} days")
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+class CsvBookingSink:
+    """All bookings in one CSV blob; reads scan the whole history."""
+
+    def __init__(self, blob_client):
+        self.appender = AppendBlobAppender(blob_client)
+
+    def write(self, rows):
+        data, header = encode_rows(rows)
+        self.appender.append(data, header)
+
+    def warm_up(self):
+        self.appender.blob.exists()
+
+    def read(self, date_from=None, date_to=None, branch=None):
+        for row in iter_rows(self.appender.blob):
+            selected_date = row.get('Selected_Date', '')
+            if date_from and selected_date < date_from or date_to and selected_date > date_to:
+                continue
+            if branch and branch_slug(row.get('Branch', '')) != branch_slug(branch):
+                continue
+            yield row
+
+
+class PartitionedBookingSink:
+    """Bookings as NDJSON blobs partitioned by Selected_Date and optionally by branch."""
+
+    def __init__(self, container_client, prefix=BOOKING_PARTITION_PREFIX, by_branch=BOOKING_PARTITION_BY_BRANCH):
+        self.container = container_client
+        self.prefix = prefix.rstrip("/")
+        self.by_branch = by_branch
+
+    def _date_prefix(self, selected_date):
+        return f"{self.prefix}/date={selected_date}/"
+
+    def path_for(self, row):
+        path = self._date_prefix(row.get('Selected_Date') or "unknown")
+        if self.by_branch:
+            return f"{path}branch={branch_slug(row.get('Branch', ''))}.ndjson"
+        return f"{path}bookings.ndjson"
+
+    def write_partition(self, path, rows):
+        data = b"".join(codec.dumps(row) + b"\n" for row in rows)
+        BlockBlobAppender(self.container.get_blob_client(path)).append(data)
+
+    def write(self, rows):
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(self.path_for(row), []).append(row)
+        for path, partition_rows in partitions.items():
+            self.write_partition(path, partition_rows)
+
+    def warm_up(self):
+        self.container.exists()
+
+    def marker(self):
+        """Blob recording that the legacy CSV was migrated into these partitions."""
+        return self.container.get_blob_client(f"{self.prefix}/{MIGRATION_MARKER}")
+
+    def partitions(self, selected_date, branch=None):
+        if self.by_branch and branch:
+            return [f"{self._date_prefix(selected_date)}branch={branch_slug(branch)}.ndjson"]
+        names = (blob.name for blob in self.container.list_blobs(name_starts_with=self._date_prefix(selected_date)))
+        return sorted(name for name in names if name.endswith(".ndjson"))
+
+    def read_partition(self, path):
+        """Stream the rows of one partition blob; nothing if it does not exist."""
+        from azure.core.exceptions import ResourceNotFoundError
+        try:
+            downloader = self.container.get_blob_client(path).download_blob()
+        except ResourceNotFoundError:
+            return
+        for line in _iter_lines(downloader.chunks()):
+            if line.strip():
+                yield codec.loads(line)
+
+    def read(self, date_from, date_to=None, branch=None):
+        """Stream rows for a date range; only the matching partitions are listed and downloaded."""
+        for selected_date in date_range(date_from, date_to or date_from):
+            for path in self.partitions(selected_date, branch):
+                for row in self.read_partition(path):
+                    if not branch or branch_slug(row.get('Branch', '')) == branch_slug(branch):
+                        yield row
+
+
+class MirroredBookingSink:
+    """Write partitions and mirror to the legacy CSV; the mirror is best effort.
+
+    Reads use the partitions once the CSV has been migrated. Before that,
+    the CSV holds the older bookings, so it is read first and followed by
+    the partition rows it is missing (a failed mirror write).
+    """
+
+    def __init__(self, primary, mirror):
+        self.primary = primary
+        self.mirror = mirror
+
+    def write(self, rows):
+        self.primary.write(rows)
+        try:
+            self.mirror.write(rows)
+        except Exception as e:
+            logger.error("Failed to mirror %s booking(s) to the CSV: %s", len(rows), e)
+
+    def read(self, date_from, date_to=None, branch=None):
+        if self.primary.marker().exists():
+            yield from self.primary.read(date_from, date_to, branch)
+            return
+        seen = set()
+        for row in self.mirror.read(date_from, date_to or date_from, branch):
+            seen.add(row.get('Appointment_ID'))
+            yield row
+        for row in self.primary.read(date_from, date_to, branch):
+            if row.get('Appointment_ID') not in seen:
+                yield row
+
+    def warm_up(self):
+        self.primary.warm_up()
+        self.mirror.warm_up()
+
+
+def create_booking_sink(service_client, storage=BOOKING_STORAGE):
+    container = service_client.get_container_client(BLOB_CONTAINER)
+    if storage == "csv":
+        return CsvBookingSink(container.get_blob_client(BLOB_CSV_PATH))
+    if storage == "partitioned":
+        return PartitionedBookingSink(container)
+    if storage == "both":
+        return MirroredBookingSink(PartitionedBookingSink(container), CsvBookingSink(container.get_blob_client(BLOB_CSV_PATH)))
+    raise ValueError(f"Unknown BOOKING_STORAGE: {storage}")
+
+
+_STOP = object()
+
+
+class BookingWriter:
+    """Serialises bookings onto one sink, grouping concurrent ones.
+
+    `append` blocks until the row is committed. A single background thread
+    takes the first waiting booking plus whatever else queued up meanwhile
+    (up to `max_batch`) and writes them together (one block per partition),
+    so under a burst of bookings the store sees a few small commits rather
+    than one per row.
+    """
+
+    def __init__(self, sink, max_batch=BOOKING_BATCH_MAX, linger_ms=BOOKING_BATCH_LINGER_MS):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.linger = linger_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="booking-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, row: dict) -> Future:
+        future = Future()
+        self._ensure_started()
+        self._queue.put((row, future))
+        return future
+
+    def append(self, row: dict, timeout=None):
+        return self.submit(row).result(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = self._collect(item)
+            self.flush([row for row, _ in batch], [future for _, future in batch])
+
+    def flush(self, rows, futures):
+        try:
+            self.sink.write(rows)
+        except Exception as e:
+            logger.error("Failed to write %s booking(s): %s", len(rows), e)
+            for future in futures:
+                future.set_exception(e)
+            return
+        logger.debug("Wrote %s booking(s)", len(rows))
+        for future in futures:
+            future.set_result(True)
+
+    def close(self, timeout=10):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_blob_service = None
+_writer = None
+_singleton_lock = threading.RLock()
+
+
+def get_blob_service_client():
+    global _blob_service
+    if _blob_service is None:
+        with _singleton_lock:
+            if _blob_service is None:
+                from azure.storage.blob import BlobServiceClient
+                _blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
+    return _blob_service
+
+
+def get_booking_writer(service_client=None):
+    """Return the process-wide writer, optionally built on a given (e.g. fake) service client."""
+    global _writer
+    if _writer is None:
+        with _singleton_lock:
+            if _writer is None:
+                _writer = BookingWriter(create_booking_sink(service_client or get_blob_service_client()))
+    return _writer
+
+
+def iter_bookings(date_from, date_to=None, branch=None):
+    """Stream stored bookings for a date range (inclusive) from the process-wide writer's store.
+
+    A missing `date_to` means the single day `date_from` for every
+    backend. The booking WAL delivers at least once, so a booking can be
+    stored twice; only the first row of each Appointment_ID is returned.
+    """
+    seen = set()
+    for row in get_booking_writer().sink.read(date_from, date_to or date_from, branch):
+        appointment_id = row.get('Appointment_ID')
+        if appointment_id:
+            if appointment_id in seen:
+                continue
+            seen.add(appointment_id)
+        yield row
+
+
+def warm_up_booking_store():
+    """Build the writer and connect to the booking container ahead of the first booking."""
+    get_booking_writer().sink.warm_up()
+
+
+def close_booking_writer():
+    global _writer
+    with _singleton_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def migrate_csv_to_partitions(service_client, batch_rows=1000, force=False):
+    """Copy every row of the legacy CSV blob into date partitions; returns the number of rows copied.
+
+    Rows are streamed and written in blocks of up to `batch_rows` per
+    partition. Rows whose Appointment_ID is already in their partition,
+    such as bookings mirrored to both stores since BOOKING_STORAGE=both,
+    are skipped. A marker blob records a finished migration so it is not
+    run twice by accident; `force` ignores it.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+    container = service_client.get_container_client(BLOB_CONTAINER)
+    sink = PartitionedBookingSink(container)
+    marker = sink.marker()
+    if not force:
+        try:
+            marker.get_blob_properties()
+            raise RuntimeError(f"{BLOB_CSV_PATH} was already migrated; pass --force to copy it again")
+        except ResourceNotFoundError:
+            pass
+    pending = {}
+    # partition path -> Appointment_IDs stored there, read when the path first comes up
+    stored = {}
+    copied = 0
+    for row in iter_rows(container.get_blob_client(BLOB_CSV_PATH)):
+        path = sink.path_for(row)
+        if path not in stored:
+            stored[path] = {stored_row.get('Appointment_ID') for stored_row in sink.read_partition(path)}
+        appointment_id = row.get('Appointment_ID')
+        if appointment_id and appointment_id in stored[path]:
+            continue
+        stored[path].add(appointment_id)
+        rows = pending.setdefault(path, [])
+        rows.append(row)
+        if len(rows) >= batch_rows:
+            sink.write_partition(path, rows)
+            copied += len(rows)
+            del pending[path]
+    for path, rows in pending.items():
+        sink.write_partition(path, rows)
+        copied += len(rows)
+    marker.upload_blob(f"source={BLOB_CSV_PATH}\nrows={copied}\n".encode("utf-8"), overwrite=True)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage booking storage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Copy the legacy CSV blob into date partitions")
+    migrate.add_argument("--batch-rows", type=int, default=1000, help="rows per partition per written block")
+    migrate.add_argument("--force", action="store_true", help="migrate again even if a previous run finished")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        copied = migrate_csv_to_partitions(get_blob_service_client(), args.batch_rows, args.force)
+        print(f"Copied {copied} bookings from {BLOB_CSV_PATH} into {BOOKING_PARTITION_PREFIX}/")
+
+
+if __name__ == "__main__":
+    main()
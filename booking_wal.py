@@ -0,0 +1,368 @@
+"""Local write-ahead log for bookings.
+
+`append` writes a booking as one NDJSON line to the active segment file
+and fsyncs it, so a booking is durable once it returns and the chat turn
+does not wait for blob storage. A background flusher seals the active
+segment every BOOKING_WAL_FLUSH_INTERVAL seconds (sooner once it holds
+BOOKING_WAL_BATCH_MAX bookings), writes sealed segments to the booking
+store in order and deletes each one after it is stored. Failed writes are
+retried with backoff, and segments left behind by a previous run are
+replayed when the log starts.
+
+Delivery is at least once: a crash between storing a segment and deleting
+it stores that segment again on restart, so readers drop repeated
+Appointment_IDs (see booking_store.iter_bookings). Each process takes the
+first numbered slot under BOOKING_WAL_DIR that no other process holds
+(BOOKING_WAL_DIR/0, /1, ...; a lock file marks a slot as held) and adopts
+the segments of slots whose process has gone, so several workers can
+share one BOOKING_WAL_DIR.
+
+A failed append is cut back off the segment, so it cannot corrupt the
+next one. Lines that still cannot be decoded are moved to
+quarantine.ndjson in the log directory instead of blocking the flush.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+
+import codec
+from booking_store import get_booking_writer
+from metrics import blob_write_errors, blob_write_seconds, counter, gauge
+
+logger = logging.getLogger(__name__)
+
+BOOKING_WAL_ENABLED = os.getenv("BOOKING_WAL_ENABLED", "true").lower() in ("1", "true", "yes")
+BOOKING_WAL_DIR = os.getenv("BOOKING_WAL_DIR", "booking_wal")
+BOOKING_WAL_FLUSH_INTERVAL = float(os.getenv("BOOKING_WAL_FLUSH_INTERVAL", "0.5"))
+BOOKING_WAL_BATCH_MAX = int(os.getenv("BOOKING_WAL_BATCH_MAX", "200"))
+BOOKING_WAL_RETRY_MAX_DELAY = float(os.getenv("BOOKING_WAL_RETRY_MAX_DELAY", "60"))
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+QUARANTINE_FILE = "quarantine.ndjson"
+
+wal_flushed = counter("booking_wal_flushed_total", "Bookings moved from the local write-ahead log to blob storage.")
+wal_quarantined = counter("booking_wal_quarantined_total", "Undecodable write-ahead log lines moved aside.")
+wal_replayed = counter("booking_wal_replayed_total", "Bookings found in the write-ahead log at startup.")
+
+
+def _segment_name(seq):
+    return f"{SEGMENT_PREFIX}{seq:012d}{SEGMENT_SUFFIX}"
+
+
+def _read_rows(path):
+    """Return (rows, undecodable lines) of a segment."""
+    rows, bad_lines = [], []
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A crash mid-append can leave a torn last line; it was never acknowledged.
+                logger.warning("Dropping incomplete last line of %s", path)
+                break
+            if not line.strip():
+                continue
+            try:
+                rows.append(codec.loads(line))
+            except ValueError:
+                bad_lines.append(line)
+    if bad_lines:
+        logger.error("%d undecodable line(s) in %s", len(bad_lines), path)
+    return rows, bad_lines
+
+
+def _write_all(f, data):
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view):]
+
+
+def _try_lock(directory):
+    """Open and exclusively lock `directory`/.lock; returns the file, or None if another process holds it."""
+    lock_file = open(os.path.join(directory, ".lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _segment_names(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BookingWal:
+    def __init__(self, write_rows, directory=BOOKING_WAL_DIR, flush_interval=BOOKING_WAL_FLUSH_INTERVAL,
+                 batch_max=BOOKING_WAL_BATCH_MAX, retry_max_delay=BOOKING_WAL_RETRY_MAX_DELAY):
+        """`write_rows(rows)` stores a batch of bookings and raises if it could not."""
+        self.write_rows = write_rows
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_max = batch_max
+        self.retry_max_delay = retry_max_delay
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = _try_lock(directory)
+        if self._lock_file is None:
+            raise RuntimeError(f"Booking WAL directory {directory} is in use by another process")
+
+        self._lock = threading.Lock()
+        # seq -> [rows, time of the first booking] for sealed segments, oldest first.
+        self._sealed = {}
+        for name in _segment_names(directory):
+            path = os.path.join(directory, name)
+            seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            self._sealed[seq] = [len(_read_rows(path)[0]), os.path.getmtime(path)]
+        self.replayed = sum(rows for rows, _ in self._sealed.values())
+        if self.replayed:
+            wal_replayed.inc(self.replayed)
+            logger.info("Replaying %s booking(s) from %s WAL segment(s)", self.replayed, len(self._sealed))
+        self._next_seq = max(self._sealed, default=0) + 1
+        self._active = None
+        self._active_seq = None
+        self._active_rows = 0
+        self._active_since = None
+        self._last_flush = None
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _path(self, seq):
+        return os.path.join(self.directory, _segment_name(seq))
+
+    def adopt(self, directory):
+        """Move the segments of another WAL directory into this one unless a live process holds it."""
+        lock_file = _try_lock(directory)
+        if lock_file is None:
+            return 0
+        adopted = 0
+        try:
+            names = _segment_names(directory)
+            for name in names:
+                source = os.path.join(directory, name)
+                rows = len(_read_rows(source)[0])
+                with self._lock:
+                    seq = self._next_seq
+                    self._next_seq += 1
+                    since = os.path.getmtime(source)
+                    os.rename(source, self._path(seq))
+                    self._sealed[seq] = [rows, since]
+                    self.replayed += rows
+                adopted += rows
+            if names:
+                _fsync_dir(self.directory)
+                _fsync_dir(directory)
+                wal_replayed.inc(adopted)
+                logger.info("Adopted %s booking(s) in %s WAL segment(s) from %s", adopted, len(names), directory)
+            return adopted
+        finally:
+            lock_file.close()
+
+    def append(self, row):
+        """Durably log one booking; returns once it is fsynced."""
+        line = codec.dumps(row) + b"\n"
+        with self._lock:
+            if self._active is None:
+                self._active_seq = self._next_seq
+                self._next_seq += 1
+                # Unbuffered, so a failed write leaves nothing behind to be flushed later.
+                self._active = open(self._path(self._active_seq), "ab", buffering=0)
+                _fsync_dir(self.directory)
+                self._active_since = time.time()
+            size = os.fstat(self._active.fileno()).st_size
+            try:
+                _write_all(self._active, line)
+                os.fsync(self._active.fileno())
+            except OSError:
+                self._cut_back(size)
+                raise
+            self._active_rows += 1
+            if self._active_rows >= self.batch_max:
+                self._wake.set()
+
+    def _cut_back(self, size):
+        # Drop the partial line of a failed append; if that fails too, start a new segment.
+        try:
+            os.ftruncate(self._active.fileno(), size)
+            os.fsync(self._active.fileno())
+        except OSError as e:
+            logger.error("Could not truncate WAL segment %s after a failed append, sealing it: %s",
+                         self._active_seq, e)
+            self._seal_locked()
+
+    def _seal(self):
+        with self._lock:
+            self._seal_locked()
+
+    def _seal_locked(self):
+        if self._active is None:
+            return
+        try:
+            self._active.close()
+        except OSError as e:
+            logger.error("Could not close WAL segment %s: %s", self._active_seq, e)
+        self._sealed[self._active_seq] = [self._active_rows, self._active_since]
+        self._active = None
+        self._active_rows = 0
+        self._active_since = None
+
+    def pending_rows(self):
+        """Rows logged but not yet stored, oldest first."""
+        with self._lock:
+            seqs = sorted(self._sealed) + ([self._active_seq] if self._active is not None else [])
+        rows = []
+        for seq in seqs:
+            try:
+                rows.extend(_read_rows(self._path(seq))[0])
+            except FileNotFoundError:
+                continue
+        return rows
+
+    def flush(self):
+        """Seal the active segment and store every sealed one; raises on the first failure."""
+        with self._flush_lock:
+            self._seal()
+            self._flush_sealed()
+
+    def _flush_sealed(self):
+        while True:
+            with self._lock:
+                if not self._sealed:
+                    break
+                seq = min(self._sealed)
+            path = self._path(seq)
+            rows, bad_lines = _read_rows(path)
+            try:
+                for start in range(0, len(rows), self.batch_max):
+                    with blob_write_seconds.time():
+                        self.write_rows(rows[start:start + self.batch_max])
+            except Exception:
+                blob_write_errors.inc()
+                raise
+            if bad_lines:
+                self._quarantine(bad_lines)
+            os.remove(path)
+            with self._lock:
+                del self._sealed[seq]
+                self._last_flush = time.time()
+            wal_flushed.inc(len(rows))
+
+    def _quarantine(self, lines):
+        with open(os.path.join(self.directory, QUARANTINE_FILE), "ab") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        wal_quarantined.inc(len(lines))
+        logger.error("Moved %d undecodable booking line(s) to %s", len(lines), QUARANTINE_FILE)
+
+    def _run(self):
+        delay = self.flush_interval
+        while not self._stopping.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                delay = self.flush_interval
+            except Exception as e:
+                delay = min(max(delay * 2, self.flush_interval), self.retry_max_delay)
+                logger.error("Failed to flush booking WAL, retrying in %.1fs: %s", delay, e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="booking-wal", daemon=True)
+            self._thread.start()
+        if self._sealed:
+            self._wake.set()
+
+    def close(self, timeout=10):
+        """Stop the flusher after one last flush attempt; unflushed segments stay for the next start."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Booking WAL not fully flushed at shutdown, %s booking(s) kept on disk: %s", self.depth(), e)
+        self._lock_file.close()
+
+    def depth(self):
+        with self._lock:
+            return self._active_rows + sum(rows for rows, _ in self._sealed.values())
+
+    def lag(self):
+        """Seconds since the oldest booking still waiting to be stored was logged (0 when empty)."""
+        with self._lock:
+            started = [since for _, since in self._sealed.values()]
+            if self._active_since is not None:
+                started.append(self._active_since)
+        return max(time.time() - min(started), 0.0) if started else 0.0
+
+    def stats(self):
+        with self._lock:
+            segments = len(self._sealed) + (1 if self._active is not None else 0)
+            last_flush = self._last_flush
+        return {
+            "directory": self.directory,
+            "queue_depth": self.depth(),
+            "segments": segments,
+            "flush_lag_seconds": self.lag(),
+            "last_flush_age_seconds": time.time() - last_flush if last_flush else None,
+            "replayed_at_start": self.replayed
+        }
+
+
+def open_booking_wal(write_rows, root=BOOKING_WAL_DIR, **kwargs):
+    """Open the first free slot under `root` and adopt the segments of abandoned ones."""
+    os.makedirs(root, exist_ok=True)
+    slot = 0
+    while True:
+        try:
+            wal = BookingWal(write_rows, directory=os.path.join(root, str(slot)), **kwargs)
+            break
+        except RuntimeError:
+            slot += 1
+    # Segments written directly under `root` by earlier versions are adopted too.
+    for name in [""] + sorted((n for n in os.listdir(root) if n.isdigit()), key=int):
+        directory = os.path.join(root, name)
+        if directory != os.path.join(root, str(slot)):
+            wal.adopt(directory)
+    return wal
+
+
+_wal = None
+_wal_lock = threading.Lock()
+
+
+def get_booking_wal():
+    global _wal
+    if _wal is None:
+        with _wal_lock:
+            if _wal is None:
+                _wal = open_booking_wal(lambda rows: get_booking_writer().sink.write(rows))
+    return _wal
+
+
+def close_booking_wal():
+    global _wal
+    with _wal_lock:
+        if _wal is not None:
+            _wal.close()
+            _wal = None
+
+
+gauge("booking_wal_queue_depth", "Bookings in the local write-ahead log not yet stored in blob storage.",
+      lambda: _wal.depth() if _wal is not None else 0)
+gauge("booking_wal_flush_lag_seconds", "Age of the oldest booking waiting in the write-ahead log.",
+      lambda: _wal.lag() if _wal is not None else 0.0)
@@ -0,0 +1,220 @@
+"""Local pincode -> nearest hospital branch index.
+
+Ranking branches by distance from a pincode is a geometric lookup, so it
+is answered from a small binary file instead of a model-serving call.
+The file is memory-mapped: pincode centroids are binary-searched in
+place and the (short) branch table is decoded once on open.
+
+Build or rebuild the index from CSV files:
+
+    python branch_index.py build --pincodes pincodes.csv --branches branches.csv --output branch_index.bin
+
+The file is replaced atomically; a running app keeps the index it opened
+and picks up a rebuilt file when it restarts.
+
+pincodes.csv columns: pincode, latitude, longitude
+branches.csv columns: branch, pincode, latitude, longitude, departments
+(departments separated by ";")
+"""
+import argparse
+import csv
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+BRANCH_INDEX_PATH = os.getenv("BRANCH_INDEX_PATH", "branch_index.bin")
+# Branches returned when the caller does not ask for all of them.
+BRANCH_INDEX_NEAREST_K = int(os.getenv("BRANCH_INDEX_NEAREST_K", "2"))
+
+MAGIC = b"BRIX"
+VERSION = 1
+HEADER = struct.Struct("<4sIIII")          # magic, version, pincodes, branches, departments
+PINCODE = struct.Struct("<Idd")            # pincode, latitude, longitude
+BRANCH = struct.Struct("<IddQIH")          # pincode, latitude, longitude, department mask, name offset, name length
+DEPARTMENT = struct.Struct("<IH")          # name offset, name length
+MAX_DEPARTMENTS = 64
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _department_key(name):
+    return name.strip().lower()
+
+
+class BranchIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_pincodes, n_branches, n_departments = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} branch index")
+        self.n_pincodes = n_pincodes
+        self._pincodes_at = HEADER.size
+        branches_at = self._pincodes_at + n_pincodes * PINCODE.size
+        departments_at = branches_at + n_branches * BRANCH.size
+        self._strings_at = departments_at + n_departments * DEPARTMENT.size
+
+        self.department_bits = {}
+        for i in range(n_departments):
+            offset, length = DEPARTMENT.unpack_from(self._mm, departments_at + i * DEPARTMENT.size)
+            self.department_bits[_department_key(self._string(offset, length))] = 1 << i
+        self.branches = []
+        for i in range(n_branches):
+            pincode, lat, lon, mask, offset, length = BRANCH.unpack_from(self._mm, branches_at + i * BRANCH.size)
+            self.branches.append((self._string(offset, length), pincode, lat, lon, mask))
+
+    def _string(self, offset, length):
+        start = self._strings_at + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def centroid(self, pincode):
+        """Binary-search the mapped pincode table; returns (lat, lon) or None."""
+        target = int(pincode)
+        lo, hi = 0, self.n_pincodes - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            code, lat, lon = PINCODE.unpack_from(self._mm, self._pincodes_at + mid * PINCODE.size)
+            if code == target:
+                return lat, lon
+            if code < target:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return None
+
+    def nearest(self, pincode, departments, k=BRANCH_INDEX_NEAREST_K, return_all=False):
+        """Branches offering any of `departments`, nearest first.
+
+        Returns dicts shaped like the find_nearest_branches task output
+        (`Pincode`, `Branch`, `distance` in km), or None when the pincode or
+        departments are unknown here and the caller should ask the model.
+        """
+        if not str(pincode).isdigit():
+            return None
+        origin = self.centroid(pincode)
+        if origin is None:
+            return None
+        mask = 0
+        for department in departments or []:
+            mask |= self.department_bits.get(_department_key(department), 0)
+        if not mask:
+            return None
+        lat, lon = origin
+        ranked = sorted(
+            (haversine_km(lat, lon, b_lat, b_lon), name, b_pincode)
+            for name, b_pincode, b_lat, b_lon, b_mask in self.branches
+            if b_mask & mask
+        )
+        if not return_all:
+            ranked = ranked[:k]
+        return [{"Pincode": b_pincode, "Branch": name, "distance": distance} for distance, name, b_pincode in ranked]
+
+    def close(self):
+        self._mm.close()
+
+
+def build_index(pincodes_csv, branches_csv, output):
+    pincodes = {}
+    with open(pincodes_csv, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            pincodes[int(row["pincode"])] = (float(row["latitude"]), float(row["longitude"]))
+
+    strings = bytearray()
+
+    def add_string(value):
+        encoded = value.encode("utf-8")
+        offset = len(strings)
+        strings.extend(encoded)
+        return offset, len(encoded)
+
+    departments = {}
+    branches = []
+    with open(branches_csv, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            mask = 0
+            for department in filter(None, (d.strip() for d in row["departments"].split(";"))):
+                key = _department_key(department)
+                if key not in departments:
+                    if len(departments) == MAX_DEPARTMENTS:
+                        raise ValueError(f"At most {MAX_DEPARTMENTS} departments are supported")
+                    departments[key] = (len(departments), department)
+                mask |= 1 << departments[key][0]
+            branches.append((int(row["pincode"]), float(row["latitude"]), float(row["longitude"]), mask, row["branch"].strip()))
+
+    department_entries = [add_string(name) for _, name in sorted(departments.values())]
+    branch_entries = [(pincode, lat, lon, mask) + add_string(name) for pincode, lat, lon, mask, name in branches]
+
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(pincodes), len(branch_entries), len(department_entries)))
+        for code in sorted(pincodes):
+            f.write(PINCODE.pack(code, *pincodes[code]))
+        for entry in branch_entries:
+            f.write(BRANCH.pack(*entry))
+        for entry in department_entries:
+            f.write(DEPARTMENT.pack(*entry))
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output)
+    return len(pincodes), len(branch_entries), len(department_entries)
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_branch_index():
+    """Open BRANCH_INDEX_PATH once; None if there is no usable index."""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                if os.path.exists(BRANCH_INDEX_PATH):
+                    try:
+                        _index = BranchIndex(BRANCH_INDEX_PATH)
+                        logger.info("Loaded branch index %s: %s pincodes, %s branches", BRANCH_INDEX_PATH, _index.n_pincodes, len(_index.branches))
+                    except (OSError, ValueError, struct.error) as e:
+                        logger.error("Could not load branch index %s: %s", BRANCH_INDEX_PATH, e)
+                else:
+                    logger.info("No branch index at %s; branch lookups use the model endpoint", BRANCH_INDEX_PATH)
+                _index_loaded = True
+    return _index
+
+
+def find_branches_locally(pincode, departments, return_all=False):
+    index = get_branch_index()
+    if index is None:
+        return None
+    branches = index.nearest(pincode, departments, return_all=return_all)
+    # An empty result may just mean the index is behind; let the model decide.
+    return branches or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local pincode to branch index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build the index from CSV files")
+    build.add_argument("--pincodes", required=True, help="CSV with pincode, latitude, longitude")
+    build.add_argument("--branches", required=True, help="CSV with branch, pincode, latitude, longitude, departments")
+    build.add_argument("--output", default=BRANCH_INDEX_PATH)
+    args = parser.parse_args()
+    if args.command == "build":
+        n_pincodes, n_branches, n_departments = build_index(args.pincodes, args.branches, args.output)
+        print(f"Wrote {args.output}: {n_pincodes} pincodes, {n_branches} branches, {n_departments} departments")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""JSON encoding and decoding for model requests and API responses.
+
+Uses orjson when it is installed and the stdlib `json` module otherwise.
+Both produce compact UTF-8 without ASCII escaping (the same output as
+Starlette's JSONResponse), so the bytes on the wire do not depend on the
+backend for the values this app sends: strings, ints, bools, None, lists,
+dicts with string keys and floats small enough to print without an
+exponent. Set JSON_CODEC=stdlib to force the fallback.
+"""
+import json
+import logging
+import os
+
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+orjson = None
+if JSON_CODEC in ("auto", "orjson"):
+    try:
+        import orjson
+    except ImportError:
+        if JSON_CODEC == "orjson":
+            raise
+        logger.info("orjson is not installed; using the stdlib json codec")
+
+BACKEND = "orjson" if orjson is not None else "stdlib"
+
+
+def dumps(value):
+    """Serialize `value` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def loads(data):
+    """Parse JSON from bytes or str; raises ValueError on malformed input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CodecJSONResponse(Response):
+    """JSON response rendered with the active codec instead of FastAPI's encoder."""
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,160 @@
+"""Typed state of one conversation.
+
+States are slotted dataclasses rather than nested dicts. The chat history
+is a bounded ring buffer of (sender, text) tuples: once it holds
+CHAT_HISTORY_MAX messages, the oldest is pushed out and counted, so a
+long conversation costs no more than a short one. Pushed-out messages are
+kept aside until the conversation store saves the state, which offloads
+them (the Redis store appends them to a per-conversation archive) or, if
+it has nowhere to put them, drops them. Branch and doctor
+records are interned, so conversations that were shown the same records
+share one copy of each. Interned records are shared and must not be
+mutated.
+
+`to_dict` / `from_dict` convert to and from plain JSON-compatible dicts
+for stores that serialize states.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+CHAT_HISTORY_MAX = int(os.getenv("CHAT_HISTORY_MAX", "32"))
+RECORD_INTERN_MAX = int(os.getenv("RECORD_INTERN_MAX", "10000"))
+
+
+class ChatHistory:
+    """The most recent chat messages; appends and iterates {'sender', 'message'} dicts.
+
+    `dropped` counts every message pushed out of the ring; those not yet
+    offloaded are returned once by `take_evicted`.
+    """
+    __slots__ = ("_messages", "dropped", "_evicted")
+
+    def __init__(self, messages=(), dropped=0, maxlen=CHAT_HISTORY_MAX):
+        self._messages = deque(maxlen=maxlen)
+        self.dropped = dropped
+        self._evicted = None
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        if len(self._messages) == self._messages.maxlen:
+            self.dropped += 1
+            sender, text = self._messages[0]
+            if self._evicted is None:
+                self._evicted = []
+            self._evicted.append({'sender': sender, 'message': text})
+        self._messages.append((sys.intern(message['sender']), message['message']))
+
+    def take_evicted(self):
+        """Messages pushed out since the last call, oldest first."""
+        evicted, self._evicted = self._evicted or [], None
+        return evicted
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return ({'sender': sender, 'message': text} for sender, text in self._messages)
+
+    def to_list(self):
+        return list(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, ChatHistory):
+            return NotImplemented
+        return self.dropped == other.dropped and list(self._messages) == list(other._messages)
+
+
+_records = OrderedDict()
+_records_lock = threading.Lock()
+
+
+def intern_record(record):
+    """Return a shared copy of `record` (a dict with hashable values), keeping at most RECORD_INTERN_MAX."""
+    try:
+        key = tuple(record.items())
+        hash(key)
+    except TypeError:
+        return record
+    with _records_lock:
+        shared = _records.get(key)
+        if shared is None:
+            shared = _records[key] = {sys.intern(k) if isinstance(k, str) else k: v for k, v in record.items()}
+            if len(_records) > RECORD_INTERN_MAX:
+                _records.popitem(last=False)
+        else:
+            _records.move_to_end(key)
+        return shared
+
+
+def intern_records(records):
+    return [intern_record(record) for record in records]
+
+
+@dataclass(slots=True)
+class PersonalDetails:
+    name: str = ''
+    age: int = 0
+    gender: str = ''
+    pin_code: str = ''
+    email: str = ''
+    symptom: str = ''
+    summary: str = ''
+
+
+@dataclass(slots=True)
+class ConversationState:
+    conversation_id: str
+    state: str = 'ask_name'
+    personal_details: PersonalDetails = field(default_factory=PersonalDetails)
+    chat_history: ChatHistory = field(default_factory=ChatHistory)
+    followup_questions: list = field(default_factory=list)
+    dynamic_followup_answers: dict = field(default_factory=dict)
+    current_question_index: int = 0
+    departments: list = field(default_factory=list)
+    selected_department: str = ''
+    selected_date: str = ''
+    branches: list = field(default_factory=list)
+    selected_branches: list = field(default_factory=list)
+    available_doctors: list = field(default_factory=list)
+    selected_doctor: dict = field(default_factory=dict)
+    appointment_id: Optional[str] = None
+    # Set from the state token in stateless mode; bookings derive their Appointment_ID from it.
+    booking_nonce: Optional[str] = None
+
+    def to_dict(self):
+        return {
+            'conversation_id': self.conversation_id,
+            'state': self.state,
+            'personal_details': {name: getattr(self.personal_details, name) for name in PersonalDetails.__slots__},
+            'chat_history': self.chat_history.to_list(),
+            'chat_history_dropped': self.chat_history.dropped,
+            'followup_questions': self.followup_questions,
+            'dynamic_followup_answers': self.dynamic_followup_answers,
+            'current_question_index': self.current_question_index,
+            'departments': self.departments,
+            'selected_department': self.selected_department,
+            'selected_date': self.selected_date,
+            'branches': self.branches,
+            'selected_branches': self.selected_branches,
+            'available_doctors': self.available_doctors,
+            'selected_doctor': self.selected_doctor,
+            'appointment_id': self.appointment_id,
+            'booking_nonce': self.booking_nonce
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        history = ChatHistory(data.pop('chat_history', ()), data.pop('chat_history_dropped', 0))
+        details = PersonalDetails(**data.pop('personal_details', {}))
+        for name in ('branches', 'selected_branches', 'available_doctors'):
+            if name in data:
+                data[name] = intern_records(data[name])
+        if data.get('selected_doctor'):
+            data['selected_doctor'] = intern_record(data['selected_doctor'])
+        return cls(personal_details=details, chat_history=history, **data)
@@ -0,0 +1,283 @@
+"""Storage for in-progress conversations.
+
+`InMemoryConversationStore` keeps states in process and evicts idle,
+ended and least-recently-used conversations. `RedisConversationStore`
+keeps them in Redis so several uvicorn workers can serve the same
+conversation; any redis-py compatible client works, including fakeredis.
+
+Chat messages pushed out of a state's bounded history are offloaded by
+`put`: the Redis store appends them to a list next to the state, readable
+with `archived_history`; the in-memory store has nowhere cheaper to keep
+them, so it drops them (they stay counted in `chat_history.dropped`).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from conversation_state import ConversationState
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATION_MAX = int(os.getenv("CONVERSATION_MAX", "100000"))
+# Conversations untouched for this long are dropped.
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "3600"))
+# Ended conversations are kept only briefly so late client calls still resolve.
+CONVERSATION_ENDED_TTL = float(os.getenv("CONVERSATION_ENDED_TTL", "300"))
+CONVERSATION_SWEEP_INTERVAL = float(os.getenv("CONVERSATION_SWEEP_INTERVAL", "30"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "conversation:")
+# Counting Redis conversations scans the keyspace, so the count is reused for this long.
+REDIS_COUNT_INTERVAL = float(os.getenv("REDIS_COUNT_INTERVAL", "60"))
+
+
+def _is_ended(state):
+    return state.state == 'end'
+
+
+class ConversationStore(ABC):
+    """Mapping-like interface used by the chat endpoints.
+
+    `remote` tells callers whether lookups do network I/O and should be
+    kept off the event loop.
+    """
+    remote = False
+
+    @abstractmethod
+    def get(self, conversation_id):
+        pass
+
+    @abstractmethod
+    def put(self, conversation_id, state):
+        pass
+
+    @abstractmethod
+    def delete(self, conversation_id):
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+    def archived_history(self, conversation_id):
+        """Chat messages offloaded from the conversation's history, oldest first."""
+        return []
+
+    def __getitem__(self, conversation_id):
+        state = self.get(conversation_id)
+        if state is None:
+            raise KeyError(conversation_id)
+        return state
+
+    def __setitem__(self, conversation_id, state):
+        self.put(conversation_id, state)
+
+    def __delitem__(self, conversation_id):
+        self.delete(conversation_id)
+
+    def __contains__(self, conversation_id):
+        return self.get(conversation_id) is not None
+
+
+class InMemoryConversationStore(ConversationStore):
+    """LRU of conversation states with idle and ended TTLs.
+
+    Entries are ordered by last access, so expired idle conversations are
+    always at the front and a sweep only touches what it evicts. Ended
+    conversations are tracked separately in the order they ended.
+    """
+
+    def __init__(self, max_size=CONVERSATION_MAX, idle_ttl=CONVERSATION_IDLE_TTL,
+                 ended_ttl=CONVERSATION_ENDED_TTL, sweep_interval=CONVERSATION_SWEEP_INTERVAL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.ended_ttl = ended_ttl
+        self.sweep_interval = sweep_interval
+        self._items = OrderedDict()
+        self._ended = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.evictions = {"idle": 0, "ended": 0, "capacity": 0}
+
+    def _remove(self, conversation_id, reason):
+        self._items.pop(conversation_id, None)
+        self._ended.pop(conversation_id, None)
+        self.evictions[reason] += 1
+
+    def _expired(self, conversation_id, last_access, now):
+        if now - last_access > self.idle_ttl:
+            return "idle"
+        ended_at = self._ended.get(conversation_id)
+        if ended_at is not None and now - ended_at > self.ended_ttl:
+            return "ended"
+        return None
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        while self._items:
+            conversation_id, (_, last_access) = next(iter(self._items.items()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._remove(conversation_id, "idle")
+        while self._ended:
+            conversation_id, ended_at = next(iter(self._ended.items()))
+            if now - ended_at <= self.ended_ttl:
+                break
+            self._remove(conversation_id, "ended")
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+    def get(self, conversation_id):
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._items.get(conversation_id)
+            if entry is None:
+                return None
+            reason = self._expired(conversation_id, entry[1], now)
+            if reason:
+                self._remove(conversation_id, reason)
+                return None
+            entry[1] = now
+            self._items.move_to_end(conversation_id)
+            return entry[0]
+
+    def put(self, conversation_id, state):
+        state.chat_history.take_evicted()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(conversation_id)
+            if entry is None:
+                self._items[conversation_id] = [state, now]
+            else:
+                entry[0] = state
+                entry[1] = now
+                self._items.move_to_end(conversation_id)
+            if _is_ended(state):
+                self._ended.setdefault(conversation_id, now)
+            else:
+                self._ended.pop(conversation_id, None)
+            while len(self._items) > self.max_size:
+                oldest = next(iter(self._items))
+                self._remove(oldest, "capacity")
+            self._maybe_sweep(now)
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._items.pop(conversation_id, None)
+            self._ended.pop(conversation_id, None)
+
+    def sweep(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "size": len(self._items),
+                "ended": len(self._ended),
+                "evictions": dict(self.evictions)
+            }
+
+
+class RedisConversationStore(ConversationStore):
+    """Conversation states as JSON strings (`ConversationState.to_dict`) in Redis, expired by key TTL.
+
+    Every save resets the key's TTL, so idle conversations expire after
+    `idle_ttl` and ended ones after `ended_ttl` without any sweeping here.
+    `len()` is a sampled count, refreshed by a SCAN at most every
+    `count_interval` seconds.
+    """
+    remote = True
+
+    def __init__(self, client, idle_ttl=CONVERSATION_IDLE_TTL, ended_ttl=CONVERSATION_ENDED_TTL,
+                 prefix=REDIS_KEY_PREFIX, count_interval=REDIS_COUNT_INTERVAL):
+        self.client = client
+        self.idle_ttl = idle_ttl
+        self.ended_ttl = ended_ttl
+        self.prefix = prefix
+        self.count_interval = count_interval
+        self._count = 0
+        self._counted_at = None
+        self._count_lock = threading.Lock()
+
+    def _key(self, conversation_id):
+        return f"{self.prefix}{conversation_id}"
+
+    def _history_key(self, conversation_id):
+        # Not under `prefix`, so len() does not count archives.
+        return f"{self.prefix.rstrip(':')}-history:{conversation_id}"
+
+    def get(self, conversation_id):
+        raw = self.client.get(self._key(conversation_id))
+        if raw is None:
+            return None
+        return ConversationState.from_dict(json.loads(raw))
+
+    def put(self, conversation_id, state):
+        ttl = max(int(self.ended_ttl if _is_ended(state) else self.idle_ttl), 1)
+        evicted = state.chat_history.take_evicted()
+        pipe = self.client.pipeline()
+        pipe.set(self._key(conversation_id), json.dumps(state.to_dict()), ex=ttl)
+        history_key = self._history_key(conversation_id)
+        if evicted:
+            pipe.rpush(history_key, *(json.dumps(message) for message in evicted))
+        # The archive expires with the state.
+        pipe.expire(history_key, ttl)
+        pipe.execute()
+
+    def delete(self, conversation_id):
+        self.client.delete(self._key(conversation_id), self._history_key(conversation_id))
+
+    def archived_history(self, conversation_id):
+        return [json.loads(raw) for raw in self.client.lrange(self._history_key(conversation_id), 0, -1)]
+
+    def __len__(self):
+        now = time.monotonic()
+        if self._counted_at is not None and now - self._counted_at < self.count_interval:
+            return self._count
+        # One scan at a time; concurrent callers get the previous count.
+        if not self._count_lock.acquire(blocking=False):
+            return self._count
+        try:
+            self._count = sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*", count=1000))
+            self._counted_at = time.monotonic()
+        finally:
+            self._count_lock.release()
+        return self._count
+
+    def stats(self):
+        try:
+            # Server-wide counter: Redis does not report expirations per key prefix.
+            expired = self.client.info("stats").get("expired_keys")
+        except Exception as e:
+            logger.debug("Could not read Redis stats: %s", e)
+            expired = None
+        return {
+            "backend": "redis",
+            "size": len(self),
+            "evictions": {"expired": expired}
+        }
+
+
+def create_conversation_store(backend=CONVERSATION_STORE):
+    if backend == "memory":
+        return InMemoryConversationStore()
+    if backend == "redis":
+        import redis
+        return RedisConversationStore(redis.Redis.from_url(REDIS_URL))
+    raise ValueError(f"Unknown CONVERSATION_STORE backend: {backend}")
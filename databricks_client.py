@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import databricks_retries
+
+logger = logging.getLogger(__name__)
+
+DATABRICKS_RETRIES = int(os.getenv("DATABRICKS_RETRIES", "3"))
+DATABRICKS_BACKOFF_FACTOR = float(os.getenv("DATABRICKS_BACKOFF_FACTOR", "0.5"))
+DATABRICKS_TIMEOUT = float(os.getenv("DATABRICKS_TIMEOUT", "120"))
+# Number of distinct hosts to keep pools for, and connections kept alive per host.
+DATABRICKS_POOL_CONNECTIONS = int(os.getenv("DATABRICKS_POOL_CONNECTIONS", "4"))
+DATABRICKS_POOL_MAXSIZE = int(os.getenv("DATABRICKS_POOL_MAXSIZE", "64"))
+# When true, callers wait for a free pooled connection instead of opening a throwaway one.
+DATABRICKS_POOL_BLOCK = os.getenv("DATABRICKS_POOL_BLOCK", "false").lower() in ("1", "true", "yes")
+# Limits for the asyncio client, which multiplexes all in-flight calls over one event loop.
+DATABRICKS_ASYNC_MAX_CONNECTIONS = int(os.getenv("DATABRICKS_ASYNC_MAX_CONNECTIONS", "1000"))
+DATABRICKS_ASYNC_MAX_KEEPALIVE = int(os.getenv("DATABRICKS_ASYNC_MAX_KEEPALIVE", "200"))
+# Connections opened by /ready before the replica takes traffic.
+DATABRICKS_WARMUP_CONNECTIONS = int(os.getenv("DATABRICKS_WARMUP_CONNECTIONS", "4"))
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class CountingRetry(Retry):
+    """urllib3 Retry that counts each retry it allows in the metrics registry."""
+
+    def increment(self, *args, **kwargs):
+        new_retry = super().increment(*args, **kwargs)
+        databricks_retries.inc(client="sync")
+        return new_retry
+
+
+class DatabricksClient:
+    """Long-lived HTTP client for the model serving endpoint.
+
+    One instance is shared by the whole process so TCP/TLS connections are
+    kept alive and reused across turns instead of being re-established for
+    every task.
+    """
+
+    def __init__(self, retries=DATABRICKS_RETRIES, backoff_factor=DATABRICKS_BACKOFF_FACTOR,
+                 timeout=DATABRICKS_TIMEOUT, pool_connections=DATABRICKS_POOL_CONNECTIONS,
+                 pool_maxsize=DATABRICKS_POOL_MAXSIZE, pool_block=DATABRICKS_POOL_BLOCK,
+                 stats_hook=None):
+        self.timeout = timeout
+        self.stats_hook = stats_hook
+        retry_strategy = CountingRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=["POST"],
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=retry_strategy
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def post(self, endpoint, body, headers):
+        """POST an already-encoded JSON body."""
+        try:
+            return self.session.post(endpoint, data=body, headers=headers, timeout=self.timeout)
+        finally:
+            if self.stats_hook:
+                try:
+                    self.stats_hook(self.pool_stats())
+                except Exception as e:
+                    logger.error("Pool stats hook failed: %s", e)
+
+    def warm_up(self, endpoint, headers, connections=DATABRICKS_WARMUP_CONNECTIONS):
+        """Open `connections` pooled connections to the endpoint's host ahead of the first call.
+
+        Each one is a GET on the endpoint; whatever status comes back, the
+        TCP/TLS connection stays in the pool. Raises if the host is unreachable.
+        """
+        def probe(_):
+            self.session.get(endpoint, headers=headers, timeout=self.timeout).close()
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(probe, range(connections)))
+
+    def pool_stats(self):
+        """Report connection reuse across all host pools.
+
+        A miss is a request that had to open a new connection (and pay the
+        TCP/TLS handshake); every other request reused a pooled connection.
+        """
+        pools = self.adapter.poolmanager.pools
+        stats = {"pools": 0, "requests": 0, "hits": 0, "misses": 0}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"] += 1
+            stats["requests"] += pool.num_requests
+            stats["misses"] += pool.num_connections
+        stats["hits"] = max(stats["requests"] - stats["misses"], 0)
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncDatabricksClient:
+    """asyncio counterpart of DatabricksClient built on httpx.
+
+    Retries mirror the urllib3 Retry policy of the sync client: retryable
+    status codes and transport errors are retried with exponential backoff,
+    and the last response is returned once the budget is spent.
+    """
+
+    def __init__(self, retries=DATABRICKS_RETRIES, backoff_factor=DATABRICKS_BACKOFF_FACTOR,
+                 timeout=DATABRICKS_TIMEOUT, max_connections=DATABRICKS_ASYNC_MAX_CONNECTIONS,
+                 max_keepalive_connections=DATABRICKS_ASYNC_MAX_KEEPALIVE):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections
+            )
+        )
+
+    def _backoff(self, attempt):
+        return self.backoff_factor * (2 ** (attempt - 1)) if attempt > 1 else 0
+
+    async def post(self, endpoint, body, headers):
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(endpoint, content=body, headers=headers)
+            except httpx.TransportError:
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    return response
+            attempt += 1
+            databricks_retries.inc(client="async")
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def warm_up(self, endpoint, headers, connections=DATABRICKS_WARMUP_CONNECTIONS):
+        """Open `connections` pooled connections ahead of the first call; see DatabricksClient.warm_up."""
+        await asyncio.gather(*(self.client.get(endpoint, headers=headers) for _ in range(connections)))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_client_loop = None
+
+
+def get_databricks_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DatabricksClient()
+    return _client
+
+
+def close_databricks_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_async_databricks_client():
+    """Return the async client bound to the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = AsyncDatabricksClient()
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_databricks_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
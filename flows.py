@@ -0,0 +1,293 @@
+"""Drivers for the conversation pipelines.
+
+Pipeline steps are written once as generators that yield the I/O they
+need (a model-serving call, a blocking helper) and receive its result.
+`run_flow` performs that I/O inline on the calling thread, while
+`run_flow_async` awaits it on the event loop, so the same step logic
+backs both the sync fallback and the native asyncio request path.
+
+A flow can also yield a `StageGraph`: a handful of named stages with
+dependencies between them. Each stage is itself a flow; the drivers start
+a stage as soon as its dependencies have finished, so independent stages
+overlap instead of running back to back.
+
+`Spawn` starts a flow in the background and hands back a handle that a
+later `Join` (possibly in another turn) waits on, which lets work start
+as soon as its inputs are known rather than when its answer is needed.
+
+A caller that wants to follow a long turn sets `progress_reporter` to a
+callable; both drivers then report each stage of a graph once it has
+finished and no earlier stage can still overturn it.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Threads used by the sync driver to overlap independent stages and run spawned flows.
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "32"))
+
+# Called with {"stage": name, "message": text} as stages complete; may be called from a worker thread.
+progress_reporter = contextvars.ContextVar("progress_reporter", default=None)
+
+
+class DatabricksCall:
+    """Send `payload` to the serving endpoint; the flow receives the response (or None)."""
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class Blocking:
+    """Run a blocking function; the async driver moves it off the event loop."""
+    __slots__ = ("fn", "args", "kwargs")
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Spawn:
+    """Start `flow` in the background; the flow receives a cancellable handle."""
+    __slots__ = ("flow",)
+
+    def __init__(self, flow):
+        self.flow = flow
+
+
+class Join:
+    """Wait for a spawned flow; the flow receives its return value."""
+    __slots__ = ("handle",)
+
+    def __init__(self, handle):
+        self.handle = handle
+
+
+class Stage:
+    """A named step of a StageGraph.
+
+    `fn(results)` must return a flow; `results` maps the names of finished
+    stages to their return values. `deps` lists the stages whose results this
+    stage needs before it can start. `progress(result)`, if given, returns
+    the message reported when the stage completes.
+    """
+    __slots__ = ("name", "fn", "deps", "progress")
+
+    def __init__(self, name, fn, deps=(), progress=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.progress = progress
+
+
+class StageFailed(Exception):
+    """Raised by a stage to abort the graph with a user-facing message."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class StageGraph:
+    """Run stages concurrently as their dependencies allow.
+
+    Stages must be listed in dependency order; that order is also their
+    priority. When a stage fails, every later stage is cancelled and its
+    result discarded, while earlier stages still run to completion: if one
+    of them fails too, its failure is the one reported. This lets a stage
+    run speculatively next to a check declared before it, with the check
+    winning whenever it rejects the request. The flow receives the dict of
+    results, or the winning StageFailed is thrown into it.
+    """
+    __slots__ = ("stages",)
+
+    def __init__(self, stages):
+        names = set()
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in names]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} depends on undeclared stages {missing}")
+            names.add(stage.name)
+        self.stages = list(stages)
+
+
+class _GraphRun:
+    """Bookkeeping shared by the sync and async StageGraph executors."""
+
+    def __init__(self, graph):
+        self.stages = graph.stages
+        self.index = {stage.name: i for i, stage in enumerate(self.stages)}
+        self.results = {}
+        self.failures = {}
+        self.started = set()
+        self.cutoff = len(self.stages)
+        self.confirmed = 0
+
+    def ready(self):
+        for stage in self.stages[:self.cutoff]:
+            if stage.name not in self.started and all(dep in self.results for dep in stage.deps):
+                self.started.add(stage.name)
+                yield stage
+
+    def finished(self, stage, result=None, error=None):
+        if error is None:
+            self.results[stage.name] = result
+            return
+        self.failures[stage.name] = error
+        self.cutoff = min(self.cutoff, self.index[stage.name])
+
+    def report_progress(self):
+        """Report finished stages whose earlier stages have all succeeded, in order."""
+        reporter = progress_reporter.get()
+        while self.confirmed < len(self.stages) and self.stages[self.confirmed].name in self.results:
+            stage = self.stages[self.confirmed]
+            self.confirmed += 1
+            if reporter is not None and stage.progress is not None:
+                try:
+                    reporter({"stage": stage.name, "message": stage.progress(self.results[stage.name])})
+                except Exception as e:
+                    logger.error("Progress report for stage %s failed: %s", stage.name, e)
+
+    def cancelled(self, stage):
+        return self.index[stage.name] > self.cutoff
+
+    def outcome(self):
+        if self.failures:
+            first = min(self.failures, key=self.index.get)
+            raise self.failures[first]
+        return self.results
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+    return _executor
+
+
+def _submit(fn, *args):
+    # Run in a copy of the caller's context so context variables (log tags) follow the work.
+    return _get_executor().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _log_background_failure(handle):
+    if not handle.cancelled() and handle.exception() is not None:
+        logger.error("Background flow failed: %s", handle.exception())
+
+
+def _run_graph(graph, send):
+    run = _GraphRun(graph)
+    pending = {}
+    while True:
+        for stage in run.ready():
+            pending[_submit(run_flow, stage.fn(dict(run.results)), send)] = stage
+        if not pending:
+            return run.outcome()
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage = pending.pop(future)
+            try:
+                run.finished(stage, result=future.result())
+            except Exception as e:
+                run.finished(stage, error=e)
+        run.report_progress()
+        for future, stage in list(pending.items()):
+            if run.cancelled(stage):
+                future.cancel()
+                del pending[future]
+
+
+async def _run_graph_async(graph, send_async):
+    run = _GraphRun(graph)
+    pending = {}
+    try:
+        while True:
+            for stage in run.ready():
+                task = asyncio.ensure_future(run_flow_async(stage.fn(dict(run.results)), send_async))
+                pending[task] = stage
+            if not pending:
+                return run.outcome()
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = pending.pop(task)
+                try:
+                    run.finished(stage, result=task.result())
+                except Exception as e:
+                    run.finished(stage, error=e)
+            run.report_progress()
+            for task, stage in list(pending.items()):
+                if run.cancelled(stage):
+                    task.cancel()
+                    del pending[task]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def run_flow(flow, send):
+    result = None
+    error = None
+    while True:
+        try:
+            effect = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        try:
+            if isinstance(effect, DatabricksCall):
+                result = send(effect.payload)
+            elif isinstance(effect, Blocking):
+                result = effect.fn(*effect.args, **effect.kwargs)
+            elif isinstance(effect, StageGraph):
+                result = _run_graph(effect, send)
+            elif isinstance(effect, Spawn):
+                result = _submit(run_flow, effect.flow, send)
+                result.add_done_callback(_log_background_failure)
+            elif isinstance(effect, Join):
+                # A handle spawned on an event loop can only be joined here once it is done.
+                result = effect.handle.result()
+            else:
+                raise TypeError(f"Unknown flow effect: {effect!r}")
+        except Exception as e:
+            error = e
+
+
+async def run_flow_async(flow, send_async):
+    result = None
+    error = None
+    while True:
+        try:
+            effect = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        try:
+            if isinstance(effect, DatabricksCall):
+                result = await send_async(effect.payload)
+            elif isinstance(effect, Blocking):
+                result = await run_in_threadpool(effect.fn, *effect.args, **effect.kwargs)
+            elif isinstance(effect, StageGraph):
+                result = await _run_graph_async(effect, send_async)
+            elif isinstance(effect, Spawn):
+                result = asyncio.ensure_future(run_flow_async(effect.flow, send_async))
+                result.add_done_callback(_log_background_failure)
+            elif isinstance(effect, Join):
+                handle = effect.handle
+                if isinstance(handle, concurrent.futures.Future):
+                    handle = asyncio.wrap_future(handle)
+                result = await asyncio.shield(handle)
+            else:
+                raise TypeError(f"Unknown flow effect: {effect!r}")
+        except Exception as e:
+            error = e
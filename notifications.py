@@ -0,0 +1,234 @@
+"""Appointment confirmation emails sent from a background worker.
+
+Bookings enqueue their email and return immediately. A single worker
+thread keeps one authenticated SMTP connection open across messages,
+reconnects when the server drops it, and retries failed sends with
+exponential backoff. Per-appointment delivery status is kept in memory.
+smtplib and the email package are imported when the first email is built
+or sent, or by `EmailNotifier.warm_up`.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import smtp_send_seconds
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "care@quantum-i.ai")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "aaxmveipnpemffwp")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+EMAIL_FROM = os.getenv("EMAIL_FROM", "ankura@hospital.com")
+
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BACKOFF = float(os.getenv("EMAIL_RETRY_BACKOFF", "1.0"))
+# Close the SMTP connection after this many idle seconds rather than letting the server time it out.
+EMAIL_IDLE_TIMEOUT = float(os.getenv("EMAIL_IDLE_TIMEOUT", "60"))
+# Delivery statuses kept for lookup; the oldest are forgotten first.
+EMAIL_STATUS_LIMIT = int(os.getenv("EMAIL_STATUS_LIMIT", "10000"))
+
+
+def build_appointment_email(appointment_data):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_FROM
+    msg['To'] = appointment_data['Email']
+    msg['Subject'] = f"Appointment Confirmation - ID: {appointment_data['Appointment_ID']}"
+    body = f"""
+        Dear {appointment_data['Patient_Name']},
+        Your appointment has been successfully booked. Below are the details:
+        Appointment ID: {appointment_data['Appointment_ID']}
+        Doctor: Dr. {appointment_data['Doctor_Name']}
+        Department: {appointment_data['Department']}
+        Branch: {appointment_data['Branch']}
+        Date: {appointment_data['Selected_Date']}
+        Time Slot: {appointment_data['Available_Time_Slot']}
+        Booking Timestamp: {appointment_data['Booking_Timestamp']}
+        Best regards,
+        Healthcare Team
+        """
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+_STOP = object()
+
+
+class EmailNotifier:
+    """Bounded queue of confirmation emails drained by one worker thread."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, queue_size=EMAIL_QUEUE_SIZE, max_attempts=EMAIL_MAX_ATTEMPTS,
+                 retry_backoff=EMAIL_RETRY_BACKOFF, idle_timeout=EMAIL_IDLE_TIMEOUT,
+                 status_limit=EMAIL_STATUS_LIMIT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.status_limit = status_limit
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._statuses = OrderedDict()
+        self._status_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _set_status(self, appointment_id, status, attempts=0, error=None):
+        with self._status_lock:
+            self._statuses[appointment_id] = {
+                "appointment_id": appointment_id,
+                "status": status,
+                "attempts": attempts,
+                "error": error,
+                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._statuses.move_to_end(appointment_id)
+            while len(self._statuses) > self.status_limit:
+                self._statuses.popitem(last=False)
+
+    def status(self, appointment_id):
+        with self._status_lock:
+            status = self._statuses.get(appointment_id)
+            return dict(status) if status else None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="email-notifier", daemon=True)
+                    self._thread.start()
+
+    def enqueue(self, appointment_data):
+        """Queue a confirmation email; returns False if the queue is full."""
+        appointment_id = appointment_data['Appointment_ID']
+        self._ensure_started()
+        # Set before the put: once queued, the worker may already be reporting "sending" or "sent".
+        self._set_status(appointment_id, "queued")
+        try:
+            self._queue.put_nowait(appointment_data)
+        except queue.Full:
+            logger.error("Email queue full, dropping confirmation for %s", appointment_id)
+            self._set_status(appointment_id, "dropped", error="queue full")
+            return False
+        return True
+
+    def warm_up(self):
+        """Load the mail modules and start the worker before the first booking."""
+        import email.mime.multipart
+        import email.mime.text
+        import smtplib
+        self._ensure_started()
+
+    def _connect(self):
+        import smtplib
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+    def _deliver(self, appointment_data):
+        import smtplib
+        appointment_id = appointment_data['Appointment_ID']
+        msg = build_appointment_email(appointment_data)
+        for attempt in range(1, self.max_attempts + 1):
+            self._set_status(appointment_id, "sending", attempts=attempt)
+            started = time.perf_counter()
+            try:
+                if self._server is None:
+                    self._connect()
+                self._server.send_message(msg)
+                smtp_send_seconds.observe(time.perf_counter() - started, outcome="sent")
+                self._set_status(appointment_id, "sent", attempts=attempt)
+                logger.debug("Email sent to %s", appointment_data['Email'])
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                smtp_send_seconds.observe(time.perf_counter() - started, outcome="refused")
+                # The address itself is bad; retrying will not help.
+                self._set_status(appointment_id, "failed", attempts=attempt, error=str(e))
+                logger.error("Email failed for %s: %s", appointment_id, e)
+                return False
+            except (smtplib.SMTPException, OSError) as e:
+                smtp_send_seconds.observe(time.perf_counter() - started, outcome="error")
+                self._disconnect()
+                if attempt == self.max_attempts:
+                    self._set_status(appointment_id, "failed", attempts=attempt, error=str(e))
+                    logger.error("Email failed for %s after %s attempts: %s", appointment_id, attempt, e)
+                    return False
+                self._set_status(appointment_id, "retrying", attempts=attempt, error=str(e))
+                # A connection the server dropped while idle is retried straight away.
+                if not (attempt == 1 and isinstance(e, smtplib.SMTPServerDisconnected)):
+                    time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if item is _STOP:
+                self._disconnect()
+                return
+            try:
+                self._deliver(item)
+            except Exception as e:
+                logger.error("Email worker error: %s", e)
+                self._set_status(item.get('Appointment_ID'), "failed", error=str(e))
+
+    def close(self, timeout=10):
+        """Send what is already queued, then stop the worker."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_email_notifier():
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = EmailNotifier()
+    return _notifier
+
+
+def close_email_notifier():
+    global _notifier
+    with _notifier_lock:
+        if _notifier is not None:
+            _notifier.close()
+            _notifier = None
@@ -0,0 +1,113 @@
+"""Request bodies for the appointment-scheduler serving endpoint.
+
+Each task declares the fields it reads, and `build_payload` sends exactly
+those. Nothing is inherited from the sample input in input_json_AS, so
+sample data cannot leak into model inputs. Encoded body sizes are tracked
+per task.
+"""
+import threading
+
+import codec
+
+# task -> {field: accepted type(s)}; every field is required.
+TASK_SCHEMAS = {
+    "get_followup_questions": {
+        "pincode": (str, int),
+        "symptom": str,
+        "age": int,
+        "gender": str,
+        "raw_text": str,
+        "appointment_data": dict,
+    },
+    "summarize_symptom": {
+        "pincode": (str, int),
+        "symptom": str,
+        "age": int,
+        "gender": str,
+        "followup_answers": list,
+        "raw_text": str,
+        "appointment_data": dict,
+    },
+    "map_to_department": {
+        "summary": str,
+    },
+    "find_nearest_branches": {
+        "pincode": (str, int),
+        "departments": list,
+        "return_all": bool,
+    },
+    "validate_appointment_date": {
+        "selected_date": str,
+        "departments": list,
+        "branches": list,
+        "pincode": (str, int),
+        "symptom": str,
+        "age": int,
+        "gender": str,
+        "summary": str,
+        "appointment_data": dict,
+    },
+    "recommend_available_doctors_with_visit_reason_summary": {
+        "departments": list,
+        "branches": list,
+        "selected_date": str,
+        "visit_reason_summary": str,
+        "pincode": (str, int),
+        "symptom": str,
+        "age": int,
+        "gender": str,
+        "appointment_data": dict,
+    },
+    "llm_maps_to_similar_cases": {
+        "grouped_text": str,
+        "summary": str,
+        "branches": list,
+    },
+    "top3_and_blocks": {
+        "final_dr_list": list,
+        "doctor_ids_ordered": list,
+        "selected_date": str,
+        "raw_text": str,
+    },
+}
+
+
+def build_payload(task, **fields):
+    """Return {"inputs": ...} for `task`, checked against its schema."""
+    schema = TASK_SCHEMAS.get(task)
+    if schema is None:
+        raise ValueError(f"Unknown task: {task}")
+    missing = schema.keys() - fields.keys()
+    if missing:
+        raise ValueError(f"{task} is missing fields: {', '.join(sorted(missing))}")
+    unknown = fields.keys() - schema.keys()
+    if unknown:
+        raise ValueError(f"{task} does not take fields: {', '.join(sorted(unknown))}")
+    for field, expected in schema.items():
+        if not isinstance(fields[field], expected):
+            raise TypeError(f"{task}.{field} has type {type(fields[field]).__name__}")
+    return {"inputs": {"task": task, **fields}}
+
+
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+def encode_payload(payload):
+    """Serialize a payload to the request body and record its size."""
+    body = codec.dumps(payload)
+    task = payload.get("inputs", {}).get("task", "unknown")
+    with _sizes_lock:
+        counters = _sizes.setdefault(task, {"requests": 0, "bytes": 0, "max_bytes": 0})
+        counters["requests"] += 1
+        counters["bytes"] += len(body)
+        counters["max_bytes"] = max(counters["max_bytes"], len(body))
+    return body
+
+
+def payload_stats():
+    with _sizes_lock:
+        return {
+            task: {**counters, "avg_bytes": counters["bytes"] / counters["requests"]}
+            for task, counters in _sizes.items()
+        }
@@ -0,0 +1,75 @@
+"""Typed `predictions` returned by each appointment-scheduler task.
+
+`parse_predictions` decodes a serving response once and validates it
+against the task's model. Missing or null fields fall back to the same
+defaults the chat flow used before, and unknown fields are ignored.
+"""
+from typing import Any, Dict, List, Union
+
+from pydantic import BaseModel, model_validator
+
+import codec
+
+
+class Predictions(BaseModel):
+    @model_validator(mode="before")
+    @classmethod
+    def _drop_nulls(cls, data):
+        # A null from the model means "not provided", so the field's default applies.
+        if isinstance(data, dict):
+            return {key: value for key, value in data.items() if value is not None}
+        return data
+
+
+class FollowupQuestions(Predictions):
+    followup_questions: List[str] = []
+
+
+class SymptomSummary(Predictions):
+    summary: str = 'No summary provided.'
+
+
+class DepartmentMapping(Predictions):
+    departments: List[str] = []
+
+
+class NearestBranches(Predictions):
+    branches: List[Dict[str, Any]] = []
+
+
+class DateValidation(Predictions):
+    valid: bool = False
+
+
+class DoctorRecommendations(Predictions):
+    final_dr_list: List[Dict[str, Any]] = []
+    grouped_text: str = ""
+
+
+class SimilarCases(Predictions):
+    doctor_ids_ordered: List[str] = []
+    raw_text: str = ""
+
+
+class TopDoctors(Predictions):
+    # Either the formatted text block parsed by parse_top_doctors or a ready list.
+    recommended_doctors: Union[str, List[Dict[str, Any]]] = []
+
+
+PREDICTION_MODELS = {
+    "get_followup_questions": FollowupQuestions,
+    "summarize_symptom": SymptomSummary,
+    "map_to_department": DepartmentMapping,
+    "find_nearest_branches": NearestBranches,
+    "validate_appointment_date": DateValidation,
+    "recommend_available_doctors_with_visit_reason_summary": DoctorRecommendations,
+    "llm_maps_to_similar_cases": SimilarCases,
+    "top3_and_blocks": TopDoctors,
+}
+
+
+def parse_predictions(task, response):
+    """Validate the `predictions` of a serving response; raises ValueError if malformed."""
+    body = codec.loads(response.content)
+    predictions = body.get('predictions') if isinstance(body, dict) else None
+    return PREDICTION_MODELS[task].model_validate(predictions or {})
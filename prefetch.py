@@ -0,0 +1,107 @@
+"""Per-conversation registry of background lookups started ahead of time.
+
+A conversation holds at most one prefetch per kind (e.g. "branches"). The
+entry is keyed on the inputs it was started with, so a lookup is only
+reused when the conversation still needs exactly that answer. Entries
+nobody collects are cancelled by a background sweep once they are older
+than PREFETCH_TTL.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Prefetches nobody collected are dropped after this many seconds.
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "900"))
+PREFETCH_SWEEP_INTERVAL = float(os.getenv("PREFETCH_SWEEP_INTERVAL", "60"))
+
+
+def _cancel(handle):
+    if isinstance(handle, asyncio.Future):
+        # Tasks belong to their event loop; the sweep runs on its own thread.
+        loop = handle.get_loop()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(handle.cancel)
+    else:
+        handle.cancel()
+
+
+class Prefetcher:
+    def __init__(self, ttl=PREFETCH_TTL, enabled=PREFETCH_ENABLED, sweep_interval=PREFETCH_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.sweep_interval = sweep_interval
+        # Oldest first, so a sweep stops at the first entry that is still fresh.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.counters = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "expired": 0}
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._entries:
+                entry_key, (_, handle, started_at) = next(iter(self._entries.items()))
+                if now - started_at <= self.ttl:
+                    break
+                del self._entries[entry_key]
+                _cancel(handle)
+                self.counters["expired"] += 1
+
+    def _run_sweeper(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Prefetch sweep failed")
+
+    def put(self, conversation_id, kind, key, handle):
+        now = time.monotonic()
+        with self._lock:
+            previous = self._entries.pop((conversation_id, kind), None)
+            if previous is not None:
+                _cancel(previous[1])
+            self._entries[(conversation_id, kind)] = (key, handle, now)
+            self.counters["started"] += 1
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._run_sweeper, name="prefetch-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def pending(self, conversation_id, kind, key):
+        with self._lock:
+            entry = self._entries.get((conversation_id, kind))
+            return entry is not None and entry[0] == key
+
+    def take(self, conversation_id, kind, key):
+        """Remove and return the handle if it was started for `key`, else None."""
+        with self._lock:
+            entry = self._entries.pop((conversation_id, kind), None)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            if entry[0] != key or entry[1].cancelled():
+                _cancel(entry[1])
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def cancel(self, conversation_id):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == conversation_id]:
+                _, handle, _ = self._entries.pop(entry_key)
+                _cancel(handle)
+                self.counters["cancelled"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "in_flight": len(self._entries), **self.counters}
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,331 @@
+"""Hedged requests and a circuit breaker for the model serving endpoint.
+
+`Resilience.call` / `call_async` wrap a single attempt at a serving call:
+
+- Hedging: once a task has enough latency samples, a call that has not
+  answered within that task's recent p95 gets a duplicate request, and
+  whichever usable answer arrives first wins. Hedges draw on a token
+  budget refilled by ordinary calls, so a slow endpoint cannot double
+  the load on itself. A sync call reserves its token up front: only then
+  do its requests run on the hedge pool (the token is refunded if no
+  hedge was needed), and every other call runs on the caller's thread, so
+  the pool only ever holds the few calls the budget allows.
+- Circuit breaker: after consecutive failures the breaker opens and
+  calls fail fast (returning None, which the flows already turn into
+  "please try again" messages). After a cool-down, a limited number of
+  probe calls are let through (half-open); a successful probe closes the
+  breaker, a failed one opens it again, and a cancelled one gives its
+  probe slot back.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Latencies kept per task, and how many are needed before hedging starts.
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+# Hedge tokens earned per call (so roughly this fraction of calls may be hedged) and the most that can be saved up.
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_MAX = float(os.getenv("HEDGE_BUDGET_MAX", "10"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "64"))
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+hedges_sent = counter("databricks_hedges_sent_total", "Duplicate requests sent after a call exceeded its task's p95.", ("task",))
+hedges_won = counter("databricks_hedges_won_total", "Hedged calls answered first by the duplicate request.", ("task",))
+breaker_rejections = counter("databricks_breaker_rejections_total", "Calls failed fast by the open circuit breaker.", ("task",))
+
+
+def is_success(response):
+    """Whether a response shows the endpoint is healthy (client errors count as healthy)."""
+    return response is not None and response.status_code < 500 and response.status_code != 429
+
+
+class LatencyTracker:
+    """Recent successful-call latencies per task."""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, task, seconds):
+        with self._lock:
+            samples = self._samples.get(task)
+            if samples is None:
+                samples = self._samples[task] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def p95(self, task, min_samples=HEDGE_MIN_SAMPLES):
+        with self._lock:
+            samples = self._samples.get(task)
+            if samples is None or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self):
+        with self._lock:
+            tasks = list(self._samples)
+        return {task: {"samples": len(self._samples[task]), "p95": self.p95(task, min_samples=1)} for task in tasks}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 half_open_probes=BREAKER_HALF_OPEN_PROBES, enabled=BREAKER_ENABLED):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.enabled = enabled
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.transitions = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning("Serving endpoint circuit breaker: %s -> %s", self.state, state)
+            self.state = state
+            self.transitions[state] += 1
+
+    def allow(self):
+        """Whether a call may go out; a True in half-open state reserves a probe."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+                self.probes_in_flight = 0
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    return False
+                self.probes_in_flight += 1
+            return True
+
+    def record(self, success):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            if success:
+                self.failures = 0
+                if self.state == HALF_OPEN:
+                    self._transition(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def release(self):
+        """Give back a half-open probe slot whose call was cancelled before it answered."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_for": time.monotonic() - self.opened_at if self.state == OPEN else None,
+                "transitions": dict(self.transitions)
+            }
+
+
+class Resilience:
+    def __init__(self, hedge_enabled=HEDGE_ENABLED, min_delay=HEDGE_MIN_DELAY, budget_ratio=HEDGE_BUDGET_RATIO,
+                 budget_max=HEDGE_BUDGET_MAX, breaker=None, latencies=None):
+        self.hedge_enabled = hedge_enabled
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = latencies or LatencyTracker()
+        self._budget = budget_max
+        self._budget_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _hedge_delay(self, task):
+        """Seconds to wait before hedging, or None if this call should not be hedged."""
+        if not self.hedge_enabled or self.breaker.state != CLOSED:
+            return None
+        p95 = self.latencies.p95(task)
+        return None if p95 is None else max(p95, self.min_delay)
+
+    def _earn(self):
+        with self._budget_lock:
+            self._budget = min(self._budget + self.budget_ratio, self.budget_max)
+
+    def _spend(self):
+        with self._budget_lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def _refund(self):
+        with self._budget_lock:
+            self._budget = min(self._budget + 1, self.budget_max)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return self._executor
+
+    def _submit(self, attempt):
+        # Copy the caller's context so log tags follow the request onto the hedge pool.
+        return self._get_executor().submit(contextvars.copy_context().run, attempt)
+
+    def _finish(self, task, started, response):
+        success = is_success(response)
+        self.breaker.record(success)
+        if success:
+            self.latencies.record(task, time.perf_counter() - started)
+        return response
+
+    def _release_on_error(self, error):
+        # A probe that never reaches _finish must not hold its half-open slot forever.
+        if isinstance(error, Exception):
+            self.breaker.record(False)
+        else:
+            self.breaker.release()
+
+    def call(self, task, attempt):
+        """Run `attempt()` (returns a response or None) with hedging and the breaker."""
+        if not self.breaker.allow():
+            breaker_rejections.inc(task=task)
+            return None
+        self._earn()
+        started = time.perf_counter()
+        try:
+            response = self._call(task, attempt)
+        except BaseException as e:
+            self._release_on_error(e)
+            raise
+        return self._finish(task, started, response)
+
+    def _call(self, task, attempt):
+        delay = self._hedge_delay(task)
+        if delay is None or not self._spend():
+            return attempt()
+
+        primary = self._submit(attempt)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            self._refund()
+            return primary.result()
+        hedges_sent.inc(task=task)
+        hedge = self._submit(attempt)
+        pending = {primary, hedge}
+        response = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response = future.result()
+                if is_success(response):
+                    if future is hedge:
+                        hedges_won.inc(task=task)
+                    # The slower request cannot be cancelled mid-flight; it finishes on the pool and is dropped.
+                    return response
+        return response
+
+    async def call_async(self, task, attempt):
+        """Async variant of `call`; `attempt()` returns an awaitable."""
+        if not self.breaker.allow():
+            breaker_rejections.inc(task=task)
+            return None
+        self._earn()
+        started = time.perf_counter()
+        try:
+            response = await self._call_async(task, attempt)
+        except BaseException as e:
+            self._release_on_error(e)
+            raise
+        return self._finish(task, started, response)
+
+    async def _call_async(self, task, attempt):
+        delay = self._hedge_delay(task)
+        if delay is None:
+            return await attempt()
+
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._spend():
+                return await primary
+            hedges_sent.inc(task=task)
+            hedge = asyncio.ensure_future(attempt())
+            pending = {primary, hedge}
+            response = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task_done in done:
+                    response = task_done.result()
+                    if is_success(response):
+                        if task_done is hedge:
+                            hedges_won.inc(task=task)
+                        return response
+            return response
+        finally:
+            for loser in pending:
+                loser.cancel()
+
+    def stats(self):
+        with self._budget_lock:
+            budget = self._budget
+        return {
+            "hedging": {
+                "enabled": self.hedge_enabled,
+                "budget": budget,
+                "sent": {labels[0]: value for labels, value in hedges_sent.values().items()},
+                "won": {labels[0]: value for labels, value in hedges_won.values().items()}
+            },
+            "breaker": self.breaker.stats(),
+            "latency": self.latencies.stats()
+        }
+
+
+_resilience = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience():
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = Resilience()
+    return _resilience
+
+
+gauge("databricks_breaker_open", "1 while the serving endpoint circuit breaker is open or half-open.",
+      lambda: 0 if get_resilience().breaker.state == CLOSED else 1)
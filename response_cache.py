@@ -0,0 +1,133 @@
+"""Cache for model-serving tasks whose output depends only on their inputs.
+
+Only the fields a task actually depends on go into its cache key, so two
+requests that differ in unrelated payload fields still share an entry.
+Entries expire per task and the whole cache is bounded with LRU eviction.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# task -> (fields the result depends on, default TTL in seconds)
+CACHEABLE_TASKS = {
+    "find_nearest_branches": (("pincode", "departments", "return_all"), 86400),
+    "map_to_department": (("summary",), 3600),
+}
+
+
+def _parse_ttls(spec):
+    """Parse RESPONSE_CACHE_TTLS, e.g. "find_nearest_branches=600,map_to_department=60"."""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        task, _, seconds = item.partition("=")
+        ttls[task.strip()] = float(seconds)
+    return ttls
+
+
+RESPONSE_CACHE_TTLS = _parse_ttls(os.getenv("RESPONSE_CACHE_TTLS", ""))
+
+
+def _normalize(value):
+    # Pincodes arrive both as "500081" and 500081; treat them alike.
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def canonical_key(task, inputs, fields):
+    """Stable hash of the task-relevant inputs."""
+    relevant = {field: _normalize(inputs.get(field)) for field in fields}
+    encoded = json.dumps(relevant, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{task}:{hashlib.sha256(encoded.encode('utf-8')).hexdigest()}"
+
+
+class ResponseCache:
+    def __init__(self, tasks=None, ttls=None, max_entries=RESPONSE_CACHE_MAX_ENTRIES, enabled=RESPONSE_CACHE_ENABLED):
+        self.tasks = dict(CACHEABLE_TASKS if tasks is None else tasks)
+        self.ttls = {task: ttl for task, (_, ttl) in self.tasks.items()}
+        self.ttls.update(RESPONSE_CACHE_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def key_for(self, payload):
+        """Cache key for a request payload, or None if its task is not cacheable."""
+        if not self.enabled:
+            return None
+        inputs = payload.get("inputs", {})
+        task = inputs.get("task")
+        if task not in self.tasks or self.ttls.get(task, 0) <= 0:
+            return None
+        return canonical_key(task, inputs, self.tasks[task][0])
+
+    def _count(self, key, outcome):
+        task = key.split(":", 1)[0]
+        counters = self._stats.setdefault(task, {"hits": 0, "misses": 0, "stores": 0, "evictions": 0})
+        counters[outcome] += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._count(key, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(key, "hits")
+            return entry[1]
+
+    def put(self, key, value):
+        ttl = self.ttls[key.split(":", 1)[0]]
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            self._count(key, "stores")
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._count(evicted, "evictions")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttls": dict(self.ttls),
+                "tasks": {task: dict(counters) for task, counters in self._stats.items()}
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
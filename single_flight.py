@@ -0,0 +1,133 @@
+"""Coalescing of identical model-serving calls that are in flight at the same time.
+
+The first caller for a key makes the upstream call; callers that arrive
+with the same key before it finishes wait for it and share its response.
+Nothing is kept once the call completes, so unlike the response cache
+this never serves a stale answer. Keys cover every input field of the
+task's schema, so only truly identical requests are merged.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+from metrics import counter
+from payloads import TASK_SCHEMAS
+from response_cache import canonical_key
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+coalesced_calls = counter(
+    "databricks_coalesced_calls_total", "Model-serving calls that shared an identical in-flight request.", ("task",))
+
+
+def _task_of(key):
+    return key.split(":", 1)[0]
+
+
+class SingleFlight:
+    def __init__(self, enabled=SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        # (event loop, key) -> [task, number of awaiting callers]
+        self._async_calls = {}
+        self._stats = {}
+
+    def key_for(self, payload):
+        """Flight key for a request payload, or None if coalescing is off or the task is unknown."""
+        if not self.enabled:
+            return None
+        inputs = payload.get("inputs", {})
+        task = inputs.get("task")
+        if task not in TASK_SCHEMAS:
+            return None
+        return canonical_key(task, inputs, TASK_SCHEMAS[task])
+
+    def _count(self, key, outcome):
+        with self._lock:
+            counters = self._stats.setdefault(_task_of(key), {"calls": 0, "coalesced": 0})
+            counters[outcome] += 1
+        if outcome == "coalesced":
+            coalesced_calls.inc(task=_task_of(key))
+
+    def do(self, key, fn):
+        """Return `fn()`, sharing the result with identical calls already in flight."""
+        if key is None:
+            return fn()
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self._count(key, "coalesced")
+            return future.result()
+
+        self._count(key, "calls")
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    async def do_async(self, key, fn):
+        """Async variant of `do`; `fn()` returns an awaitable.
+
+        The shared call runs as its own task, so a caller that is cancelled
+        (for example a discarded speculative stage) does not cancel it for
+        the others. It is cancelled only once every caller has gone.
+        """
+        if key is None:
+            return await fn()
+        flight_key = (asyncio.get_running_loop(), key)
+        flight = self._async_calls.get(flight_key)
+        if flight is None:
+            flight = self._async_calls[flight_key] = [asyncio.ensure_future(fn()), 0]
+            flight[0].add_done_callback(
+                lambda _: self._async_calls.pop(flight_key, None) if self._async_calls.get(flight_key) is flight else None
+            )
+            self._count(key, "calls")
+        else:
+            self._count(key, "coalesced")
+
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # Unlist it now, so a caller arriving before the task finishes cancelling starts a fresh call.
+                if self._async_calls.get(flight_key) is flight:
+                    del self._async_calls[flight_key]
+                flight[0].cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "tasks": {task: dict(counters) for task, counters in self._stats.items()}
+            }
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,159 @@
+"""Conversation state carried by the client as an encrypted token.
+
+With STATELESS_MODE on, the server keeps nothing between turns: /start and
+/chatbot return the conversation state as a token and the client sends it
+back with the next turn, so any worker on any node can serve it. A token
+is the state's `to_dict` as JSON, zlib-compressed and sealed with AES-GCM,
+so the patient details in it can be neither read nor changed by whoever
+holds it:
+
+    base64url(version byte + 12-byte IV + AES-GCM(zlib(json([issued_at, state]))))
+
+Every token gets a fresh `booking_nonce`, and bookings made from a token
+take their Appointment_ID from it. Sending the same token again therefore
+books under the same ID, which the slot index rejects as a duplicate.
+
+Only the last STATE_TOKEN_CHAT_HISTORY chat messages are kept (the rest
+are counted as dropped), which bounds the token size. Tokens older than
+STATE_TOKEN_MAX_AGE are rejected. STATE_TOKEN_SECRET may list several
+comma-separated secrets: the first encrypts, any of them decrypts, so a
+new secret can be rolled out before the old one is retired.
+"""
+import base64
+import binascii
+import os
+import threading
+import time
+import zlib
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+import codec
+from conversation_state import ConversationState
+from metrics import counter, histogram
+
+STATELESS_MODE = os.getenv("STATELESS_MODE", "false").lower() in ("1", "true", "yes")
+STATE_TOKEN_SECRET = os.getenv("STATE_TOKEN_SECRET", "")
+STATE_TOKEN_CHAT_HISTORY = int(os.getenv("STATE_TOKEN_CHAT_HISTORY", "6"))
+# Matches the in-memory store's idle TTL by default.
+STATE_TOKEN_MAX_AGE = float(os.getenv("STATE_TOKEN_MAX_AGE", "3600"))
+# Larger tokens, compressed or not, are refused before they are decoded.
+STATE_TOKEN_MAX_BYTES = int(os.getenv("STATE_TOKEN_MAX_BYTES", "65536"))
+
+TOKEN_VERSION = 2
+IV_BYTES = 12
+
+state_token_bytes = histogram(
+    "state_token_bytes", "Size of the state tokens handed to clients.",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536))
+state_tokens_rejected = counter(
+    "state_tokens_rejected_total", "State tokens that could not be used, by reason.", ("reason",))
+
+
+class InvalidStateToken(ValueError):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive_key(secret):
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"state-token").derive(secret.encode("utf-8"))
+
+
+def new_booking_nonce():
+    return os.urandom(6).hex()
+
+
+class StateTokenCodec:
+    def __init__(self, secrets, history_max=STATE_TOKEN_CHAT_HISTORY, max_age=STATE_TOKEN_MAX_AGE,
+                 max_bytes=STATE_TOKEN_MAX_BYTES):
+        if not secrets:
+            raise ValueError("At least one state token secret is required")
+        self.ciphers = [AESGCM(_derive_key(secret)) for secret in secrets]
+        self.history_max = history_max
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def encode(self, state):
+        data = state.to_dict()
+        data['booking_nonce'] = new_booking_nonce()
+        history = data['chat_history']
+        if len(history) > self.history_max:
+            data['chat_history_dropped'] += len(history) - self.history_max
+            data['chat_history'] = history[len(history) - self.history_max:]
+        header = bytes([TOKEN_VERSION])
+        iv = os.urandom(IV_BYTES)
+        sealed = self.ciphers[0].encrypt(iv, zlib.compress(codec.dumps([int(time.time()), data])), header)
+        token = _b64encode(header + iv + sealed)
+        state_token_bytes.observe(len(token))
+        return token
+
+    def _reject(self, reason, message):
+        state_tokens_rejected.inc(reason=reason)
+        raise InvalidStateToken(reason, message)
+
+    def _open(self, iv, sealed, header):
+        for cipher in self.ciphers:
+            try:
+                return cipher.decrypt(iv, sealed, header)
+            except InvalidTag:
+                continue
+        return None
+
+    def decode(self, token):
+        """Decrypt and verify `token` and return its ConversationState; raises InvalidStateToken."""
+        if len(token) > self.max_bytes:
+            self._reject("too_large", "State token is too large")
+        try:
+            raw = _b64decode(token)
+        except (binascii.Error, ValueError):
+            self._reject("malformed", "State token is malformed")
+        if len(raw) < 1 + IV_BYTES:
+            self._reject("malformed", "State token is malformed")
+        if raw[0] != TOKEN_VERSION:
+            self._reject("version", f"Unsupported state token version {raw[0]}")
+        compressed = self._open(raw[1:1 + IV_BYTES], raw[1 + IV_BYTES:], raw[:1])
+        if compressed is None:
+            self._reject("authentication", "State token could not be authenticated")
+        decompressor = zlib.decompressobj()
+        try:
+            plain = decompressor.decompress(compressed, self.max_bytes * 16)
+        except zlib.error:
+            self._reject("malformed", "State token is malformed")
+        if decompressor.unconsumed_tail:
+            self._reject("too_large", "State token is too large")
+        try:
+            issued_at, data = codec.loads(plain)
+        except (ValueError, TypeError):
+            self._reject("malformed", "State token is malformed")
+        if time.time() - issued_at > self.max_age:
+            self._reject("expired", "State token has expired")
+        return ConversationState.from_dict(data)
+
+
+_codec = None
+_codec_lock = threading.Lock()
+
+
+def get_state_token_codec():
+    """Process-wide codec built from STATE_TOKEN_SECRET; raises RuntimeError if no secret is set."""
+    global _codec
+    if _codec is None:
+        with _codec_lock:
+            if _codec is None:
+                secrets = [secret.strip() for secret in STATE_TOKEN_SECRET.split(",") if secret.strip()]
+                if not secrets:
+                    raise RuntimeError("STATELESS_MODE needs STATE_TOKEN_SECRET")
+                _codec = StateTokenCodec(secrets)
+    return _codec
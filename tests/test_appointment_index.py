@@ -0,0 +1,48 @@
+from appointment_index import DUPLICATE, RESERVED, AppointmentIdIndex
+
+
+def _row(appointment_id):
+    return {"Appointment_ID": appointment_id, "Doctor_ID": "D1", "Selected_Date": "2026-10-21",
+            "Available_Time_Slot": "4:30 PM - 7:30 PM"}
+
+
+def test_reserve_rejects_a_taken_appointment_id():
+    index = AppointmentIdIndex()
+    assert index.reserve("APT-1") == RESERVED
+    assert index.reserve("APT-1") == DUPLICATE
+    stats = index.stats()
+    assert stats["appointments"] == 1
+    assert stats["reserved"] == 1
+    assert stats["duplicates"] == 1
+
+
+def test_release_frees_the_id():
+    index = AppointmentIdIndex()
+    index.reserve("APT-1")
+    index.release("APT-1")
+    assert index.stats()["appointments"] == 0
+    assert index.reserve("APT-1") == RESERVED
+
+
+def test_release_of_an_unknown_id_is_ignored():
+    index = AppointmentIdIndex()
+    index.release("APT-missing")
+    assert index.stats()["released"] == 0
+
+
+def test_rebuild_dedups_appointment_ids_and_skips_rows_without_one():
+    index = AppointmentIdIndex()
+    rows = [_row("APT-1"), _row("APT-1"), _row("APT-2"), _row("")]
+    assert index.rebuild(iter(rows)) == 4
+    stats = index.stats()
+    assert stats["appointments"] == 2
+    assert stats["rebuilt"]["rows"] == 4
+    assert index.reserve("APT-2") == DUPLICATE
+
+
+def test_rebuild_replaces_earlier_reservations():
+    index = AppointmentIdIndex()
+    index.reserve("APT-old")
+    index.rebuild([_row("APT-1")])
+    assert index.reserve("APT-old") == RESERVED
+    assert index.stats()["appointments"] == 2
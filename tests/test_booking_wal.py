@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+import booking_wal
+from booking_wal import QUARANTINE_FILE, BookingWal, _segment_name, open_booking_wal
+
+
+class Store:
+    def __init__(self, failures=0):
+        self.rows = []
+        self.failures = failures
+
+    def write(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("blob unavailable")
+        self.rows.extend(rows)
+
+
+def _booking(n):
+    return {"Appointment_ID": f"APT-{n}", "Doctor_ID": "D1"}
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".ndjson") and name != QUARANTINE_FILE)
+
+
+def test_flush_stores_bookings_in_order_and_removes_segments(tmp_path):
+    store = Store()
+    wal = BookingWal(store.write, directory=str(tmp_path))
+    for n in range(3):
+        wal.append(_booking(n))
+    assert wal.depth() == 3
+    wal.flush()
+    assert store.rows == [_booking(0), _booking(1), _booking(2)]
+    assert wal.depth() == 0
+    assert _segments(tmp_path) == []
+    wal.close()
+
+
+def test_torn_last_line_is_dropped_on_replay(tmp_path):
+    with open(tmp_path / _segment_name(1), "wb") as f:
+        f.write(b'{"Appointment_ID": "APT-1"}\n{"Appointment_ID": "AP')
+    store = Store()
+    wal = BookingWal(store.write, directory=str(tmp_path))
+    assert wal.replayed == 1
+    wal.flush()
+    assert store.rows == [{"Appointment_ID": "APT-1"}]
+    wal.close()
+
+
+def test_failed_flush_keeps_segments_for_the_next_start(tmp_path):
+    wal = BookingWal(Store(failures=10).write, directory=str(tmp_path))
+    wal.append(_booking(1))
+    with pytest.raises(OSError):
+        wal.flush()
+    wal.close()
+    assert len(_segments(tmp_path)) == 1
+
+    store = Store()
+    wal = BookingWal(store.write, directory=str(tmp_path))
+    assert wal.replayed == 1
+    wal.append(_booking(2))
+    wal.flush()
+    assert store.rows == [_booking(1), _booking(2)]
+    wal.close()
+
+
+def test_segment_stored_before_a_crash_is_stored_again(tmp_path):
+    stored = []
+
+    def store_then_crash(rows):
+        stored.extend(rows)
+        raise OSError("crashed before the segment was removed")
+
+    wal = BookingWal(store_then_crash, directory=str(tmp_path))
+    wal.append(_booking(1))
+    with pytest.raises(OSError):
+        wal.flush()
+    wal._lock_file.close()
+
+    wal = BookingWal(stored.extend, directory=str(tmp_path))
+    wal.flush()
+    assert stored == [_booking(1), _booking(1)]
+    wal.close()
+
+
+def test_undecodable_lines_are_quarantined(tmp_path):
+    with open(tmp_path / _segment_name(1), "wb") as f:
+        f.write(b'{"Appointment_ID": "APT-1"}\nnot json\n{"Appointment_ID": "APT-2"}\n')
+    store = Store()
+    wal = BookingWal(store.write, directory=str(tmp_path))
+    wal.flush()
+    assert store.rows == [{"Appointment_ID": "APT-1"}, {"Appointment_ID": "APT-2"}]
+    assert (tmp_path / QUARANTINE_FILE).read_bytes() == b"not json\n"
+    assert _segments(tmp_path) == []
+    wal.close()
+
+
+def test_failed_append_is_cut_back(tmp_path, monkeypatch):
+    store = Store()
+    wal = BookingWal(store.write, directory=str(tmp_path))
+    wal.append(_booking(1))
+    write_all = booking_wal._write_all
+
+    def partial_write(f, data):
+        f.write(data[:5])
+        raise OSError("no space left on device")
+
+    monkeypatch.setattr(booking_wal, "_write_all", partial_write)
+    with pytest.raises(OSError):
+        wal.append(_booking(2))
+    monkeypatch.setattr(booking_wal, "_write_all", write_all)
+    wal.append(_booking(3))
+    wal.flush()
+    assert store.rows == [_booking(1), _booking(3)]
+    wal.close()
+
+
+def test_directory_is_locked_to_one_log(tmp_path):
+    wal = BookingWal(Store().write, directory=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        BookingWal(Store().write, directory=str(tmp_path))
+    wal.close()
+
+
+def test_each_process_takes_its_own_slot(tmp_path):
+    first = open_booking_wal(Store().write, root=str(tmp_path))
+    second = open_booking_wal(Store().write, root=str(tmp_path))
+    assert first.directory == str(tmp_path / "0")
+    assert second.directory == str(tmp_path / "1")
+    first.close()
+    second.close()
+
+
+def test_segments_of_abandoned_slots_are_adopted(tmp_path):
+    os.makedirs(tmp_path / "1")
+    with open(tmp_path / "1" / _segment_name(1), "wb") as f:
+        f.write(b'{"Appointment_ID": "APT-1"}\n')
+    with open(tmp_path / _segment_name(7), "wb") as f:
+        f.write(b'{"Appointment_ID": "APT-0"}\n')
+    store = Store()
+    wal = open_booking_wal(store.write, root=str(tmp_path))
+    assert wal.replayed == 2
+    wal.flush()
+    assert store.rows == [{"Appointment_ID": "APT-0"}, {"Appointment_ID": "APT-1"}]
+    assert _segments(tmp_path / "1") == []
+    wal.close()
+
+
+def test_held_slots_are_not_adopted(tmp_path):
+    held = open_booking_wal(Store().write, root=str(tmp_path))
+    held.append(_booking(1))
+    held._seal()
+    other = open_booking_wal(Store().write, root=str(tmp_path))
+    assert other.replayed == 0
+    assert len(_segments(tmp_path / "0")) == 1
+    other.close()
+    held.close()
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from conversation_state import ConversationState
+from state_token import InvalidStateToken, StateTokenCodec, _b64decode, _b64encode
+
+
+def _state():
+    state = ConversationState("conv-1")
+    state.state = "ask_symptoms"
+    state.personal_details.name = "Asha"
+    for n in range(10):
+        state.chat_history.append({"sender": "user", "message": f"message {n}"})
+    return state
+
+
+def _reason(codec, token):
+    with pytest.raises(InvalidStateToken) as excinfo:
+        codec.decode(token)
+    return excinfo.value.reason
+
+
+def test_round_trip_keeps_state_and_trims_history():
+    codec = StateTokenCodec(["secret"], history_max=3)
+    decoded = codec.decode(codec.encode(_state()))
+    assert decoded.conversation_id == "conv-1"
+    assert decoded.state == "ask_symptoms"
+    assert decoded.personal_details.name == "Asha"
+    assert [m["message"] for m in decoded.chat_history] == ["message 7", "message 8", "message 9"]
+    assert decoded.chat_history.dropped == 7
+
+
+def test_patient_details_are_not_readable():
+    token = StateTokenCodec(["secret"]).encode(_state())
+    assert b"Asha" not in _b64decode(token)
+
+
+def test_every_token_gets_a_fresh_booking_nonce():
+    codec = StateTokenCodec(["secret"])
+    state = _state()
+    first = codec.decode(codec.encode(state)).booking_nonce
+    second = codec.decode(codec.encode(state)).booking_nonce
+    assert first and second and first != second
+
+
+def test_tampered_token_is_rejected():
+    codec = StateTokenCodec(["secret"])
+    raw = bytearray(_b64decode(codec.encode(_state())))
+    raw[-1] ^= 1
+    assert _reason(codec, _b64encode(bytes(raw))) == "authentication"
+
+
+def test_token_from_another_secret_is_rejected():
+    token = StateTokenCodec(["other"]).encode(_state())
+    assert _reason(StateTokenCodec(["secret"]), token) == "authentication"
+
+
+def test_retired_secret_still_decodes_during_rotation():
+    token = StateTokenCodec(["old"]).encode(_state())
+    assert StateTokenCodec(["new", "old"]).decode(token).conversation_id == "conv-1"
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    codec = StateTokenCodec(["secret"], max_age=60)
+    token = codec.encode(_state())
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert _reason(codec, token) == "expired"
+
+
+def test_oversized_token_is_rejected_before_decoding():
+    codec = StateTokenCodec(["secret"], max_bytes=64)
+    assert _reason(codec, "A" * 65) == "too_large"
+
+
+def test_malformed_tokens_are_rejected():
+    codec = StateTokenCodec(["secret"])
+    assert _reason(codec, "not base64!") == "malformed"
+    assert _reason(codec, _b64encode(b"\x02short")) == "malformed"
+
+
+def test_unknown_version_is_rejected():
+    codec = StateTokenCodec(["secret"])
+    raw = _b64decode(codec.encode(_state()))
+    assert _reason(codec, _b64encode(b"\x01" + raw[1:])) == "version"
+
+
+def test_a_secret_is_required():
+    with pytest.raises(ValueError):
+        StateTokenCodec([])